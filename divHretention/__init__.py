@@ -1,3 +1,5 @@
+import importlib
+
 from .data.list_of_files import list_of_high_temp_files, list_of_low_temp_files
 
 from .compute_implantation_coefficients_angle import \
@@ -5,14 +7,32 @@ from .compute_implantation_coefficients_angle import \
 from .inventory_T_c import estimate_inventory_with_gp_regression
 from .compute_inventory import compute_c_max, \
     compute_inventory, DEFAULT_TIME, database_inv_sig, \
-    fetch_inventory_and_error, compute_surface_temperature
-from .extract_data import Exposition
+    database_inv_sig_sparse, \
+    fetch_inventory_and_error, compute_surface_temperature, \
+    set_cache_directory, fetch_inventory_table, precompute_inventory_models, \
+    set_inventory_gp_hyperpars
+from .extract_data import Exposition, ExpositionBatch, stream_exposition
+
+# the plotting API is imported on first access (see __getattr__) so that
+# matplotlib stays out of the core import path
+_plotting_modules = {
+    "plot_Tc_map_with_subplots": "plot_2d_contour",
+    "create_2d_inv_array": "plot_2d_contour",
+    "plot_T_c_inv_along_divertor": "plot_along_divertor",
+    "plot_particle_exposure_along_divertor": "plot_along_divertor",
+    "plot_along_divertor": "plot_along_divertor",
+    "create_correspondance_dict": "plot_along_divertor",
+    "plot_inv_with_uncertainty": "plot_along_divertor",
+}
+
 
-from .plotting.plot_2d_contour import plot_Tc_map_with_subplots, \
-    create_2d_inv_array
-from .plotting.plot_along_divertor import \
-    plot_T_c_inv_along_divertor, plot_particle_exposure_along_divertor, \
-    plot_along_divertor, create_correspondance_dict, plot_inv_with_uncertainty
+def __getattr__(name):
+    if name in _plotting_modules:
+        module = importlib.import_module(
+            ".plotting." + _plotting_modules[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(
+        "module {} has no attribute {}".format(__name__, name))
 
 
 step_mb = 6
@@ -0,0 +1,212 @@
+import os
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+import numpy as np
+
+import divHretention
+from .process_T_c_data import database
+from .inventory_T_c import build_inventory_gp
+
+
+class DiskCache:
+    """On-disk cache of the trained inventory GPs. For each exposure time,
+    the training set and the fitted hyperparameters are stored in a .npz
+    file so that the GP can be rebuilt without optimising the
+    hyperparameters again.
+
+    The entries are keyed by (time, divHretention.step_mb, database
+    version): entries written with another step or another FESTIM database
+    are ignored.
+
+    Args:
+        directory (str): path of the cache directory. It is created if it
+            doesn't exist.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def filename(self, time):
+        """Returns the file path of the entry for a given time
+
+        Args:
+            time (float): time (s)
+
+        Returns:
+            str: the file path
+        """
+        name = "inventory_gp_t={}_step={}_{}.npz".format(
+            repr(float(time)), divHretention.step_mb, database.version)
+        return os.path.join(self.directory, name)
+
+    def load(self, time):
+        """Rebuilds the GP for a given time if it is in the cache
+
+        Args:
+            time (float): time (s)
+
+        Returns:
+            GpRegressor or None: the GP, None if the time is not in the cache
+        """
+        filename = self.filename(time)
+        if not os.path.exists(filename):
+            return None
+        with np.load(filename) as entry:
+            return build_inventory_gp(
+                entry["x"], entry["y"], hyperpars=entry["hyperpars"])
+
+    def save(self, time, GP):
+        """Writes the training set and the hyperparameters of a GP in the
+        cache
+
+        Args:
+            time (float): time (s)
+            GP (GpRegressor): the trained GP
+        """
+        # write in a temporary file first so that concurrent processes never
+        # read an incomplete entry
+        fd, tmp_filename = tempfile.mkstemp(
+            suffix=".npz", dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, x=GP.x, y=GP.y, hyperpars=GP.hyperpars)
+        os.replace(tmp_filename, self.filename(time))
+
+
+class LRUCache(MutableMapping):
+    """Dict-like cache of the inventory callables keyed by exposure time,
+    with a least recently used (LRU) eviction policy.
+
+    Keys can be normalised so that close times share the same entry: either
+    by snapping them to a grid of log10(time) or by reusing an existing key
+    within a relative tolerance.
+
+    All the operations are thread-safe. key_lock() provides a lock per key
+    so that a single thread computes a missing entry. The locks are only
+    kept while they are in use, so that keys that are never stored (eg.
+    interpolated or failed entries) don't accumulate locks.
+
+    Args:
+        maxsize (int, optional): maximum number of entries. If None, the
+            cache is unbounded. Defaults to 128.
+        rtol (float, optional): relative tolerance under which a key is
+            considered equal to an existing key. Defaults to 1e-9.
+        log_grid_step (float, optional): if not None, the keys are snapped
+            to 10**(n*log_grid_step) with n integer. Defaults to None.
+
+    Attributes:
+        hits (int): number of successful lookups
+        misses (int): number of failed lookups
+        evictions (int): number of evicted entries
+    """
+    def __init__(self, maxsize=128, rtol=1e-9, log_grid_step=None):
+        self.maxsize = maxsize
+        self.rtol = rtol
+        self.log_grid_step = log_grid_step
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        # a lock is discarded when no thread holds a reference to it
+        self._key_locks = weakref.WeakValueDictionary()
+
+    def normalise_key(self, key):
+        """Returns the key under which an entry for key is stored
+
+        Args:
+            key (float): time (s)
+
+        Returns:
+            float: the normalised key
+        """
+        if self.log_grid_step is not None:
+            n = np.round(np.log10(key)/self.log_grid_step)
+            return float(10**(n*self.log_grid_step))
+        with self._lock:
+            if key not in self._entries:
+                return self._close_key(key, self._entries)
+        return key
+
+    def _close_key(self, key, existing_keys):
+        # returns the first of existing_keys within rtol of key, or key
+        if self.rtol:
+            for existing_key in existing_keys:
+                if abs(existing_key - key) <= self.rtol*abs(existing_key):
+                    return existing_key
+        return key
+
+    def key_lock(self, key):
+        """Returns the lock of a key. Keys within rtol of a key whose lock is
+        in use share this lock, so that concurrent requests for close keys
+        compute a single entry.
+
+        Args:
+            key (float): time (s)
+
+        Returns:
+            float, threading.Lock: the normalised key (under which the entry
+            has to be stored) and its lock
+        """
+        with self._lock:
+            key = self.normalise_key(key)
+            if key not in self._entries and self.log_grid_step is None:
+                key = self._close_key(key, list(self._key_locks.keys()))
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = threading.Lock()
+                self._key_locks[key] = lock
+            return key, lock
+
+    def peek(self, key):
+        """Returns the entry of a key without updating the counters and the
+        LRU order
+
+        Args:
+            key (float): time (s)
+
+        Returns:
+            object: the entry, None if the key is not in the cache
+        """
+        with self._lock:
+            return self._entries.get(self.normalise_key(key))
+
+    def __getitem__(self, key):
+        with self._lock:
+            key = self.normalise_key(key)
+            if key not in self._entries:
+                self.misses += 1
+                raise KeyError(key)
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            key = self.normalise_key(key)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while self.maxsize is not None and \
+                    len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __delitem__(self, key):
+        with self._lock:
+            key = self.normalise_key(key)
+            del self._entries[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            return self.normalise_key(key) in self._entries
+
+    def __iter__(self):
+        # iterate over a copy so that entries can be deleted in the loop
+        with self._lock:
+            return iter(list(self._entries))
+
+    def __len__(self):
+        return len(self._entries)
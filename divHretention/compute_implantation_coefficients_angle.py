@@ -1,8 +1,9 @@
+import threading
+from collections import OrderedDict
+from os import path
+
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.interpolate import interp2d
-from inference.gp_tools import GpRegressor
-from inference.gp_tools import RationalQuadratic, SquaredExponential
+from scipy.interpolate import RectBivariateSpline
 
 try:
     import importlib.resources as pkg_resources
@@ -12,40 +13,418 @@ except ImportError:
 
 from . import data as data_module
 
+REFLECTION_TABLE_FILENAME = path.join(
+    path.dirname(data_module.__file__), "reflection_coeff_table.npz")
 
-with pkg_resources.path(data_module, "data_TRIM_energy_angle.csv") as p:
-    data = np.genfromtxt(p, delimiter=";", names=True)
+_GP_reflection_coeff = None
+_GP_reflection_coeff_hyperpars = None
+_GP_reflection_coeff_lock = threading.Lock()
 
-step = 5
-sim_points = [
-    [np.log10(E), theta]
-    for E, theta in
-    zip(
-        data["Incident_energy"][::step],
-        data["theta_inc"][::step])]
+_reflection_coeff_table = None
+_reflection_coeff_table_lock = threading.Lock()
 
-# interpolate reflection coeff
-GP_reflection_coeff = GpRegressor(
-    sim_points, data["Reflection_coeff"][::step], kernel=RationalQuadratic)
+# memo of the reflection coefficients keyed by (backend, log10(energy),
+# angle), disabled if None
+_reflection_coeff_memo = None
 
 
-def reflection_coeff(energy, angle):
-    """Computes the reflection coefficient based on the particles incident
-    energy and angle.
+def train_GP_reflection_coeff(hyperpars=None):
+    """Trains the gaussian process regression of the reflection coefficient
+    on the TRIM data (log10(energy), angle).
+
+    Args:
+        hyperpars (list, optional): hyperparameters of the GP. If None, the
+            hyperparameters are optimised. Defaults to None.
+
+    Returns:
+        GpRegressor: callable, usage GP((np.log10(energy), angle))
+    """
+    # inference.gp_tools imports matplotlib.pyplot
+    from inference.gp_tools import GpRegressor, RationalQuadratic
+
+    with pkg_resources.path(data_module, "data_TRIM_energy_angle.csv") as p:
+        data = np.genfromtxt(p, delimiter=";", names=True)
+
+    step = 5
+    sim_points = [
+        [np.log10(E), theta]
+        for E, theta in
+        zip(
+            data["Incident_energy"][::step],
+            data["theta_inc"][::step])]
+
+    # interpolate reflection coeff
+    GP = GpRegressor(
+        sim_points, data["Reflection_coeff"][::step], kernel=RationalQuadratic,
+        hyperpars=hyperpars)
+    return GP
+
+
+def get_GP_reflection_coeff():
+    """Returns the GP of the reflection coefficient. The GP is trained on
+    first call (thread-safe) and reused afterwards.
+
+    Returns:
+        GpRegressor: callable, usage GP((np.log10(energy), angle))
+    """
+    global _GP_reflection_coeff
+    if _GP_reflection_coeff is None:
+        with _GP_reflection_coeff_lock:
+            if _GP_reflection_coeff is None:
+                _GP_reflection_coeff = train_GP_reflection_coeff(
+                    hyperpars=_GP_reflection_coeff_hyperpars)
+    return _GP_reflection_coeff
+
+
+def set_GP_reflection_coeff_hyperpars(hyperpars):
+    """Sets pre-fitted hyperparameters for the GP of the reflection
+    coefficient so that the hyperparameters optimisation is skipped. The
+    GP will be trained again on next use.
+
+    Args:
+        hyperpars (list): hyperparameters of the GP (eg.
+            get_GP_reflection_coeff().hyperpars). If None, the
+            hyperparameters will be optimised.
+    """
+    global _GP_reflection_coeff, _GP_reflection_coeff_hyperpars
+    with _GP_reflection_coeff_lock:
+        _GP_reflection_coeff_hyperpars = hyperpars
+        _GP_reflection_coeff = None
+    # the table in memory was sampled from the previous GP
+    set_reflection_coeff_table(None)
+
+
+class ReflectionCoeffTable:
+    """Lookup table of the reflection coefficient GP sampled on a regular
+    (log10(energy), angle) grid and interpolated with bicubic splines.
+    Points outside the grid are evaluated with the GP.
+
+    The angular length scale of the GP is small (the TRIM data is only
+    available at 0, 45, 60 and 80 deg), hence the fine grid along the
+    angle.
+
+    Args:
+        values (numpy.array): reflection coefficients on the grid with shape
+            (len(log_E_grid), len(angle_grid))
+        log_E_grid (numpy.array): grid of log10(energy) (energy in eV)
+        angle_grid (numpy.array): grid of angles (deg)
+
+    Attributes:
+        max_error (float): maximum absolute difference between the table and
+            the GP at the centres of the grid cells (NaN if unknown)
+        hyperpars (numpy.array): hyperparameters of the sampled GP (None if
+            unknown)
+    """
+    def __init__(self, values, log_E_grid, angle_grid):
+        self.values = np.asarray(values)
+        self.log_E_grid = np.asarray(log_E_grid)
+        self.angle_grid = np.asarray(angle_grid)
+        self.spline = RectBivariateSpline(
+            self.log_E_grid, self.angle_grid, self.values)
+        self.max_error = np.nan
+        self.hyperpars = None
+
+    @classmethod
+    def from_gp(
+            cls, GP, log_E_bounds=(-6, np.log10(1400)), angle_bounds=(0, 90),
+            num_E=91, num_angle=361):
+        """Samples a GP on a regular grid. The defaults cover the TRIM
+        data (up to 1400 eV) and the low energies (down to 1e-6 eV) of the
+        atoms and ions in the exposure files, at all angles.
+
+        Args:
+            GP (callable): GP trained on (log10(energy), angle)
+            log_E_bounds (tuple, optional): limits of the grid for
+                log10(energy). Defaults to (-6, log10(1400)).
+            angle_bounds (tuple, optional): limits of the grid for the
+                angle (deg). Defaults to (0, 90).
+            num_E (int, optional): number of grid points for
+                log10(energy). Defaults to 91.
+            num_angle (int, optional): number of grid points for the angle.
+                Defaults to 361.
+
+        Returns:
+            ReflectionCoeffTable: the table
+        """
+        log_E_grid = np.linspace(*log_E_bounds, num=num_E)
+        angle_grid = np.linspace(*angle_bounds, num=num_angle)
+        table = cls(
+            _sample(GP, log_E_grid, angle_grid), log_E_grid, angle_grid)
+
+        # compare with the GP at the centres of the cells
+        log_E_centres = 0.5*(log_E_grid[1:] + log_E_grid[:-1])
+        angle_centres = 0.5*(angle_grid[1:] + angle_grid[:-1])
+        table.max_error = np.abs(
+            table.spline(log_E_centres, angle_centres) -
+            _sample(GP, log_E_centres, angle_centres)).max()
+        if getattr(GP, "hyperpars", None) is not None:
+            table.hyperpars = np.asarray(GP.hyperpars, dtype=float)
+        return table
+
+    def save(self, filename):
+        """Writes the table in a .npz file
+
+        Args:
+            filename (str): path of the .npz file
+        """
+        arrays = dict(
+            values=self.values, log_E_grid=self.log_E_grid,
+            angle_grid=self.angle_grid, max_error=self.max_error)
+        if self.hyperpars is not None:
+            arrays["hyperpars"] = self.hyperpars
+        np.savez(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """Reads a table written by save()
+
+        Args:
+            filename (str): path of the .npz file
+
+        Returns:
+            ReflectionCoeffTable: the table
+        """
+        with np.load(filename) as f:
+            table = cls(f["values"], f["log_E_grid"], f["angle_grid"])
+            table.max_error = float(f["max_error"])
+            if "hyperpars" in f.files:
+                table.hyperpars = f["hyperpars"]
+        return table
+
+    def __call__(self, log_E, angle):
+        """Evaluates the table
+
+        Args:
+            log_E (numpy.array): log10(energy) (energy in eV)
+            angle (numpy.array): angles (deg)
+
+        Returns:
+            numpy.array: the reflection coefficients
+        """
+        log_E, angle = np.broadcast_arrays(
+            np.asarray(log_E, dtype=float), np.asarray(angle, dtype=float))
+        values = self.spline.ev(log_E, angle)
+        outside = (log_E < self.log_E_grid[0]) | \
+            (log_E > self.log_E_grid[-1]) | \
+            (angle < self.angle_grid[0]) | (angle > self.angle_grid[-1])
+        if np.any(outside):
+            values[outside] = get_GP_reflection_coeff()(
+                np.column_stack((log_E[outside], angle[outside])))[0]
+        return values
+
+
+def _sample(GP, log_E, angle):
+    EE, AA = np.meshgrid(log_E, angle, indexing="ij")
+    # only the mean is tabulated
+    mu = GP(np.column_stack((EE.ravel(), AA.ravel())))[0]
+    return mu.reshape(EE.shape)
+
+
+def build_reflection_coeff_table(filename=REFLECTION_TABLE_FILENAME):
+    """Samples the GP of the reflection coefficient and writes the table
+    used by get_reflection_coeff_table().
 
     Args:
-        energy (float): incident energy in eV
-        angle (float): angle of incidence in degree (0deg corresponds to a
-            normal incidence)
+        filename (str, optional): path of the .npz file. Defaults to
+            REFLECTION_TABLE_FILENAME.
 
     Returns:
-        float: the reflection coefficient between 0 and 1. 1 = all particles
-        are reflected, 0 = all particles are implanted
+        ReflectionCoeffTable: the table
     """
-    if energy == 0:
-        return 0
+    table = ReflectionCoeffTable.from_gp(get_GP_reflection_coeff())
+    table.save(filename)
+    return table
+
+
+def get_reflection_coeff_table():
+    """Returns the table of the reflection coefficient. On first call
+    (thread-safe), the table shipped with the package
+    (REFLECTION_TABLE_FILENAME) is read, unless other hyperparameters were
+    set with set_GP_reflection_coeff_hyperpars(), in which case the table
+    is sampled from the GP.
+
+    Returns:
+        ReflectionCoeffTable: the table
+    """
+    global _reflection_coeff_table
+    if _reflection_coeff_table is None:
+        with _reflection_coeff_table_lock:
+            if _reflection_coeff_table is None:
+                table = None
+                if path.exists(REFLECTION_TABLE_FILENAME):
+                    table = ReflectionCoeffTable.load(
+                        REFLECTION_TABLE_FILENAME)
+                    hyperpars = _GP_reflection_coeff_hyperpars
+                    if hyperpars is not None and not (
+                            table.hyperpars is not None and
+                            np.allclose(table.hyperpars, hyperpars)):
+                        table = None
+                if table is None:
+                    table = ReflectionCoeffTable.from_gp(
+                        get_GP_reflection_coeff())
+                _reflection_coeff_table = table
+    return _reflection_coeff_table
+
+
+def set_reflection_coeff_table(table):
+    """Sets the table used by the "table" backend of reflection_coeff (eg.
+    ReflectionCoeffTable.load(filename) for a table stored in a user
+    directory).
+
+    Args:
+        table (ReflectionCoeffTable): the table. If None, the table will be
+            read or sampled again on next use.
+    """
+    global _reflection_coeff_table
+    with _reflection_coeff_table_lock:
+        _reflection_coeff_table = table
+    if _reflection_coeff_memo is not None:
+        _reflection_coeff_memo.clear()
+
+
+class ReflectionCoeffMemo:
+    """Bounded memo of reflection coefficients keyed by (backend,
+    log10(energy), angle), with a least recently used eviction policy.
+    The operations are thread-safe.
+
+    Args:
+        maxsize (int): maximum number of memoised pairs
+
+    Attributes:
+        hits (int): number of successful lookups
+        misses (int): number of failed lookups
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        """Returns the memoised value of a key
+
+        Args:
+            key (tuple): (backend, log10(energy), angle)
+
+        Returns:
+            float or None: the reflection coefficient, None if the key is
+            not memoised
+        """
+        with self._lock:
+            if key not in self._values:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._values.move_to_end(key)
+            return self._values[key]
+
+    def store(self, key, value):
+        """Memoises the value of a key
+
+        Args:
+            key (tuple): (backend, log10(energy), angle)
+            value (float): the reflection coefficient
+        """
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def __len__(self):
+        return len(self._values)
+
+
+def set_reflection_coeff_memo(maxsize):
+    """Enables the memoisation of the reflection coefficients across calls
+    of reflection_coeff, so that the (energy, angle) pairs that have already
+    been evaluated are not predicted again.
+
+    Args:
+        maxsize (int): maximum number of memoised pairs, the least recently
+            used pairs are discarded. If 0, the memoisation is disabled.
+
+    Returns:
+        ReflectionCoeffMemo or None: the memo
+    """
+    global _reflection_coeff_memo
+    if maxsize:
+        _reflection_coeff_memo = ReflectionCoeffMemo(maxsize)
     else:
-        return GP_reflection_coeff((np.log10(energy), angle))[0]
+        _reflection_coeff_memo = None
+    return _reflection_coeff_memo
+
+
+def __getattr__(name):
+    # backward compatibility: GP_reflection_coeff is trained on access
+    if name == "GP_reflection_coeff":
+        return get_GP_reflection_coeff()
+    raise AttributeError(
+        "module {} has no attribute {}".format(__name__, name))
+
+
+def reflection_coeff(energy, angle, backend="gp"):
+    """Computes the reflection coefficient based on the particles incident
+    energy and angle. Arrays are evaluated with a single GP call on the
+    distinct (energy, angle) pairs (see also set_reflection_coeff_memo()).
+
+    Args:
+        energy (float or numpy.array): incident energy in eV
+        angle (float or numpy.array): angle of incidence in degree (0deg
+            corresponds to a normal incidence)
+        backend (str, optional): "gp" (the GP trained on the TRIM data) or
+            "table" (interpolation in get_reflection_coeff_table()).
+            Defaults to "gp".
+
+    Returns:
+        float or numpy.array: the reflection coefficient between 0 and 1.
+        1 = all particles are reflected, 0 = all particles are implanted
+    """
+    if backend not in ["gp", "table"]:
+        raise ValueError("Unknown backend")
+    energy, angle = np.broadcast_arrays(
+        np.asarray(energy, dtype=float), np.asarray(angle, dtype=float))
+    coeff = np.zeros(energy.shape)
+    non_zero = energy != 0
+    if np.any(non_zero):
+        # evaluate each distinct (energy, angle) pair once
+        pairs, inverse = np.unique(
+            np.column_stack((np.log10(energy[non_zero]), angle[non_zero])),
+            axis=0, return_inverse=True)
+        coeff[non_zero] = _memoised_reflection_coeff(pairs, backend)[
+            inverse.ravel()]
+    return coeff[()]
+
+
+def _predict_reflection_coeff(pairs, backend):
+    if backend == "table":
+        return get_reflection_coeff_table()(pairs[:, 0], pairs[:, 1])
+    return get_GP_reflection_coeff()(pairs)[0]
+
+
+def _memoised_reflection_coeff(pairs, backend):
+    memo = _reflection_coeff_memo
+    if memo is None:
+        return _predict_reflection_coeff(pairs, backend)
+    keys = [(backend, log_E, angle) for log_E, angle in pairs.tolist()]
+    values = np.empty(len(keys))
+    missing = np.zeros(len(keys), dtype=bool)
+    for i, key in enumerate(keys):
+        value = memo.lookup(key)
+        if value is None:
+            missing[i] = True
+        else:
+            values[i] = value
+    if np.any(missing):
+        values[missing] = _predict_reflection_coeff(pairs[missing], backend)
+        for i in np.flatnonzero(missing):
+            memo.store(keys[i], values[i])
+    return values
 
 # interpolate implantation range
 
@@ -56,16 +435,18 @@ def implantation_range(energy, angle):
     implantation range = 1.88e-10*energy^0.5924
 
     Args:
-        energy (float): incident energy in eV
-        angle (float): angle of incidence in degree (0deg corresponds to a
-            normal incidence). Note: there is no angular dependence in this
-            model
+        energy (float or numpy.array): incident energy in eV
+        angle (float or numpy.array): angle of incidence in degree (0deg
+            corresponds to a normal incidence). Note: there is no angular
+            dependence in this model
 
     Returns:
-        float: the implantation range in m
+        float or numpy.array: the implantation range in m
     """
-    return 1.88e-10*energy**0.5924
+    energy, angle = np.broadcast_arrays(
+        np.asarray(energy, dtype=float), np.asarray(angle, dtype=float))
+    return (1.88e-10*energy**0.5924)[()]
 
 
 if __name__ == '__main__':
-    pass
+    build_reflection_coeff_table()
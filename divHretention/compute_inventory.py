@@ -1,52 +1,456 @@
-import matplotlib.pyplot as plt
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
 from . import implantation_range, reflection_coeff
 from . import estimate_inventory_with_gp_regression
+from .inventory_T_c import estimate_inventory_with_time_gp_regression, \
+    estimate_inventory_with_shared_gp_regression, InventoryTable, \
+    build_inventory_gp
+from .cache import DiskCache, LRUCache
 
 DEFAULT_TIME = 1e7
 
-database_inv_sig = {}
+database_inv_sig = LRUCache()
+
+# entries of the "sparse" backend
+database_inv_sig_sparse = LRUCache()
+
+disk_cache = None
+
+# if True, the hyperparameters optimisation of a new inventory GP starts from
+# the hyperparameters of the GP of the closest cached time
+warm_start = True
+
+inventory_gp_hyperpars = None
+
+inventory_surrogate = None
+_inventory_surrogate_lock = threading.Lock()
+
+
+def set_cache_directory(directory):
+    """Sets the directory of the on-disk cache of the trained GPs. When set,
+    fetch_inventory_and_error() looks for the GP in this directory before
+    training it and stores newly trained GPs in it.
+
+    Args:
+        directory (str): path of the cache directory. If None, the on-disk
+            cache is disabled.
+    """
+    global disk_cache
+    if directory is None:
+        disk_cache = None
+    else:
+        disk_cache = DiskCache(directory)
+
+
+def evaluate_inventory_and_error(GP, T, c):
+    """Evaluates the inventory and the standard deviation with a single call
+    to the GP. Points where c == 0 have a null inventory and standard
+    deviation and are not passed to the GP.
+
+    Args:
+        GP (GpRegressor): the GP trained on (T, log10(c)), log10(inventory)
+        T (numpy.array): Surface temperature (K)
+        c (numpy.array): Surface concentration (H m-3)
+
+    Returns:
+        numpy.array, numpy.array: inventories (H/m), standard deviations
+    """
+    T, c = np.broadcast_arrays(
+        np.asarray(T, dtype=float), np.asarray(c, dtype=float))
+    inventories = np.zeros(c.shape)
+    sigmas = np.zeros(c.shape)
+    non_zero = c != 0
+    if np.any(non_zero):
+        mu, sig = GP(np.column_stack((T[non_zero], np.log10(c[non_zero]))))
+        inventories[non_zero] = 10**mu
+        sigmas[non_zero] = sig
+    return inventories, sigmas
 
 
-def fetch_inventory_and_error(time):
-    """Fetch the inventory and error for a given time
+def set_inventory_gp_hyperpars(hyperpars):
+    """Sets fixed hyperparameters for the inventory GPs so that the
+    hyperparameters optimisation is skipped. Only GPs trained afterwards
+    are affected.
+
+    Args:
+        hyperpars (list): hyperparameters of the GPs (eg.
+            database_inv_sig[time]["GP"].hyperpars). If None, the
+            hyperparameters will be optimised.
+    """
+    global inventory_gp_hyperpars
+    inventory_gp_hyperpars = hyperpars
+
+
+def _closest_hyperpars(time, cache):
+    """Returns the hyperparameters of the GP of the cached time closest to
+    time in log scale
 
     Args:
         time (float): time (s)
+        cache (LRUCache): the cached entries
 
     Returns:
-        callable, callable: inventory(T, c), standard deviation(T, c)
+        numpy.array or None: the hyperparameters, None if the cache is empty
     """
-    if time in database_inv_sig.keys():  # fetch in database
-        inv_T_c_local = database_inv_sig[time]["inv"]
-        sig_inv_local = database_inv_sig[time]["sig"]
-    else:  # if time is not in the database
-        GP = estimate_inventory_with_gp_regression(time=time)
-
-        def inv_T_c_local(T, c):
-            if c == 0:
-                val = 0
-            else:
-                val = 10**GP((T, np.log10(c)))[0][0]
-            return val
-
-        def sig_inv_local(T, c):
-            if c == 0:
-                val = 0
-            else:
-                val = GP((T, np.log10(c)))[1][0]
-            return val
+    GPs = {}
+    for t in cache:
+        entry = cache.peek(t)
+        if entry is not None and "GP" in entry:
+            GPs[t] = entry["GP"]
+    if not GPs:
+        return None
+    closest_time = min(GPs, key=lambda t: abs(np.log10(t/time)))
+    return GPs[closest_time].hyperpars
+
+
+def get_inventory_surrogate():
+    """Returns the GP regressing the inventory over (T, log10(c),
+    log10(time)). The GP is trained on first call and reused afterwards.
+
+    Returns:
+        GpRegressor: callable, usage
+        GP((600, np.log10(1e20), np.log10(1e5)))
+    """
+    global inventory_surrogate
+    if inventory_surrogate is None:
+        with _inventory_surrogate_lock:
+            if inventory_surrogate is None:
+                inventory_surrogate = \
+                    estimate_inventory_with_time_gp_regression()
+    return inventory_surrogate
+
+
+def _make_entry(inv_and_sig_local):
+    """Creates the inventory and standard deviation callables from a
+    callable returning both
+
+    Args:
+        inv_and_sig_local (callable): inventory and standard deviation
+            (T, c)
+
+    Returns:
+        dict: entry with the keys "inv", "sig" and "inv_and_sig"
+    """
+    def inv_T_c_local(T, c):
+        # [()] returns a scalar for scalar arguments
+        return inv_and_sig_local(T, c)[0][()]
+
+    def sig_inv_local(T, c):
+        return inv_and_sig_local(T, c)[1][()]
+
+    return {
+        "inv": inv_T_c_local,
+        "sig": sig_inv_local,
+        "inv_and_sig": inv_and_sig_local
+    }
+
+
+def _make_gp_entry(GP):
+    """Creates the inventory and standard deviation callables of a GP
+
+    Args:
+        GP (callable): GP trained on (T, log10(c)), log10(inventory)
+
+    Returns:
+        dict: entry with the keys "inv", "sig", "inv_and_sig" and "GP"
+    """
+    def inv_and_sig_local(T, c):
+        return evaluate_inventory_and_error(GP, T, c)
+
+    entry = _make_entry(inv_and_sig_local)
+    entry["GP"] = GP
+    return entry
+
+
+def _interpolate_entries(time, max_log_time_gap, cache):
+    """Creates an entry for a given time by interpolating in log10(time)
+    between the two closest entries of the cache bracketing this
+    time. log10(inventory) and the standard deviation are interpolated
+    linearly and the standard deviation is widened by w*(1-w)*d, where w is
+    the interpolation weight and d the difference of log10(inventory)
+    between the two entries.
+
+    Args:
+        time (float): time (s)
+        max_log_time_gap (float): maximum gap in log10(time) between the
+            two bracketing entries
+        cache (LRUCache): the cached entries
+
+    Returns:
+        dict or None: entry with the keys "inv", "sig" and "inv_and_sig".
+        None if there is no bracket narrower than max_log_time_gap or if a
+        bracketing entry was evicted.
+    """
+    times = list(cache)
+    lower = [t for t in times if t < time]
+    upper = [t for t in times if t > time]
+    if not lower or not upper:
+        return None
+    t_1, t_2 = max(lower), min(upper)
+    if np.log10(t_2) - np.log10(t_1) > max_log_time_gap:
+        return None
+    w = (np.log10(time) - np.log10(t_1))/(np.log10(t_2) - np.log10(t_1))
+    # the brackets may have been evicted by another thread in the meantime.
+    # peek() doesn't count the lookups as hits nor refresh the LRU order
+    entry_1, entry_2 = cache.peek(t_1), cache.peek(t_2)
+    if entry_1 is None or entry_2 is None:
+        return None
+    inv_and_sig_1 = entry_1["inv_and_sig"]
+    inv_and_sig_2 = entry_2["inv_and_sig"]
+
+    def inv_and_sig_local(T, c):
+        inv_1, sig_1 = inv_and_sig_1(T, c)
+        inv_2, sig_2 = inv_and_sig_2(T, c)
+        inventories = np.zeros(inv_1.shape)
+        sigmas = np.zeros(inv_1.shape)
+        non_zero = (inv_1 != 0) & (inv_2 != 0)
+        log_inv_1 = np.log10(inv_1[non_zero])
+        log_inv_2 = np.log10(inv_2[non_zero])
+        inventories[non_zero] = 10**((1 - w)*log_inv_1 + w*log_inv_2)
+        sigmas[non_zero] = (1 - w)*sig_1[non_zero] + w*sig_2[non_zero] + \
+            w*(1 - w)*np.abs(log_inv_2 - log_inv_1)
+        return inventories, sigmas
+
+    return _make_entry(inv_and_sig_local)
+
+
+def _fetch_entry(
+        time, backend="gp", interpolate=False, max_log_time_gap=1.0):
+    """Fetch the entry of database_inv_sig (or database_inv_sig_sparse) for
+    a given time. If the time is not in the database, the GP is read from
+    the disk cache or trained.
+
+    Args:
+        time (float): time (s)
+        backend (str, optional): "gp", "surrogate", "table" or "sparse" (see
+            fetch_inventory_and_error()). Defaults to "gp".
+        interpolate (bool, optional): see fetch_inventory_and_error().
+            Defaults to False.
+        max_log_time_gap (float, optional): see
+            fetch_inventory_and_error(). Defaults to 1.0.
+
+    Raises:
+        ValueError: if the backend is unknown
+
+    Returns:
+        dict: entry with the keys "inv", "sig" and "inv_and_sig"
+    """
+    if backend not in ["gp", "surrogate", "table", "sparse"]:
+        raise ValueError("Unknown backend")
+
+    if backend == "table":
+        entry = _fetch_entry(
+            time, interpolate=interpolate, max_log_time_gap=max_log_time_gap)
+        if "GP" not in entry:  # interpolated entry, no GP to tabulate
+            return entry
+        if "table" not in entry:
+            _, lock = database_inv_sig.key_lock(time)
+            with lock:
+                if "table" not in entry:
+                    # the table is built from the GP and stored with it
+                    entry["table"] = _make_gp_entry(
+                        InventoryTable(entry["GP"]))
+        return entry["table"]
+
+    if backend == "surrogate":
+        surrogate = get_inventory_surrogate()
+        log_time = np.log10(time)
+
+        def GP_at_time(points):
+            points = np.asarray(points)
+            return surrogate(
+                np.column_stack((points, np.full(len(points), log_time))))
+
+        return _make_gp_entry(GP_at_time)
+
+    if backend == "sparse":
+        cache, regressor = database_inv_sig_sparse, "sparse"
+    else:
+        cache, regressor = database_inv_sig, "exact"
+
+    entry = cache.get(time)
+    if entry is not None:  # fetch in database
+        return entry
+
+    # the disk cache only stores exact GPs
+    use_disk_cache = disk_cache is not None and regressor == "exact"
+    # only one thread trains the GP of a given time (or of close times),
+    # the others wait for it. The GP is trained at the normalised key so
+    # that it is valid for all the times sharing this entry
+    time, lock = cache.key_lock(time)
+    with lock:
+        entry = cache.peek(time)
+        if entry is not None:  # trained by another thread
+            return entry
+
+        GP = None
+        if use_disk_cache:
+            GP = disk_cache.load(time)
+        if GP is None and interpolate:
+            entry = _interpolate_entries(time, max_log_time_gap, cache)
+            if entry is not None:
+                return entry
+        if GP is None:
+            initial_hyperpars = None
+            if warm_start and inventory_gp_hyperpars is None:
+                initial_hyperpars = _closest_hyperpars(time, cache)
+            GP = estimate_inventory_with_gp_regression(
+                time=time, regressor=regressor,
+                hyperpars=inventory_gp_hyperpars,
+                initial_hyperpars=initial_hyperpars)
+            if use_disk_cache:
+                disk_cache.save(time, GP)
 
         # add to database for later use
-        database_inv_sig[time] = {
-            "inv": inv_T_c_local,
-            "sig": sig_inv_local
-        }
-    return inv_T_c_local, sig_inv_local
+        entry = _make_gp_entry(GP)
+        cache[time] = entry
+    return entry
+
+
+def _train_inventory_gp(time, hyperpars=None):
+    """Trains the GP of a given time. Used in the worker processes of
+    precompute_inventory_models().
+
+    Args:
+        time (float): time (s)
+        hyperpars (list, optional): fixed hyperparameters. Defaults to
+            None.
+
+    Returns:
+        numpy.array, numpy.array, numpy.array: training points, training
+        values, hyperparameters
+    """
+    GP = estimate_inventory_with_gp_regression(
+        time=time, hyperpars=hyperpars)
+    return GP.x, GP.y, GP.hyperpars
+
+
+def precompute_inventory_models(times, workers=None, shared=False):
+    """Trains the GPs of several times in parallel processes and stores
+    them in database_inv_sig (and in the disk cache if it is set). Times
+    already in database_inv_sig or in the disk cache are not trained again.
+
+    If shared is True, the GPs of all the times share the same covariance
+    hyperparameters (inventory_gp_hyperpars if set, otherwise optimised on
+    the median time) and the covariance matrix is factorised only once.
 
+    Note: on platforms where processes are spawned (Windows, MacOS), this
+    function must be called under a ``if __name__ == "__main__":`` guard.
 
-def compute_inventory(T, c_max, time):
+    Args:
+        times (list): times (s)
+        workers (int, optional): number of processes. If None, the number
+            of processors is used. Defaults to None.
+        shared (bool, optional): if True, the GPs are trained in the
+            current process with a shared factorisation. Defaults to False.
+    """
+    to_train = []
+    for time in times:
+        time = database_inv_sig.normalise_key(time)
+        if time in database_inv_sig or time in to_train:
+            continue
+        GP = None
+        if disk_cache is not None:
+            GP = disk_cache.load(time)
+        if GP is None:
+            to_train.append(time)
+        else:
+            database_inv_sig[time] = _make_gp_entry(GP)
+
+    if not to_train:
+        return
+    if shared:
+        cov_hyperpars = None
+        if inventory_gp_hyperpars is not None:
+            # the constant means are estimated for each time
+            cov_hyperpars = np.concatenate(
+                ([0], inventory_gp_hyperpars[1:]))
+        shared_GP = estimate_inventory_with_shared_gp_regression(
+            to_train, hyperpars=cov_hyperpars)
+        for i, time in enumerate(to_train):
+            GP = shared_GP.regressor(i)
+            if disk_cache is not None:
+                disk_cache.save(time, GP)
+            database_inv_sig[time] = _make_gp_entry(GP)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            _train_inventory_gp, to_train,
+            [inventory_gp_hyperpars]*len(to_train))
+        for time, (x, y, hyperpars) in zip(to_train, results):
+            # rebuilding the GP with its hyperparameters skips the
+            # optimisation
+            GP = build_inventory_gp(x, y, hyperpars=hyperpars)
+            if disk_cache is not None:
+                disk_cache.save(time, GP)
+            database_inv_sig[time] = _make_gp_entry(GP)
+
+
+def fetch_inventory_table(time):
+    """Fetch the lookup table of the inventory GP for a given time (see
+    the "table" backend of fetch_inventory_and_error()). Its attribute
+    max_error is the maximum error on log10(inventory) with respect to the
+    GP.
+
+    Args:
+        time (float): time (s)
+
+    Returns:
+        InventoryTable: the lookup table
+    """
+    return _fetch_entry(time, backend="table")["GP"]
+
+
+def fetch_inventory_and_error(
+        time, backend="gp", interpolate=False, max_log_time_gap=1.0):
+    """Fetch the inventory and error for a given time.
+
+    The returned callables accept scalars or arrays of any shape for T and c
+    (broadcasted together) and return a scalar or an array of the broadcasted
+    shape.
+
+    Args:
+        time (float): time (s)
+        backend (str, optional): "gp" uses a GP trained for this specific
+            time (stored in database_inv_sig). "surrogate" uses a single GP
+            trained once over (T, log10(c), log10(time)) that answers for
+            any time without further training (about 7 s of training).
+            Its root mean square error on log10(inventory) over the
+            database curves is about 0.03-0.04 above 1e5 s (0.02-0.05 for
+            the "gp" backend) and 0.25-0.4 below 1e4 s, like the "gp"
+            backend. "table" samples the GP of the
+            "gp" backend once on a dense (T, log10(c)) grid and interpolates
+            it (see :class:`InventoryTable
+            <divHretention.inventory_T_c.InventoryTable>`). "sparse" uses a
+            sparse GP trained on all the database points for this specific
+            time (see :class:`SparseGpRegressor
+            <divHretention.inventory_T_c.SparseGpRegressor>`, stored in
+            database_inv_sig_sparse). Defaults to "gp".
+        interpolate (bool, optional): only for the "gp", "table" and
+            "sparse" backends. If True and time is not in database_inv_sig, the
+            inventory is interpolated in log10(time) between the two cached
+            times bracketing time (the standard deviation is widened
+            accordingly) instead of training a new GP. A GP is trained if
+            there is no such bracket. Defaults to False.
+        max_log_time_gap (float, optional): maximum gap in log10(time)
+            between the bracketing times for the interpolation. Defaults to
+            1.0.
+
+    Returns:
+        callable, callable: inventory(T, c), standard deviation(T, c)
+    """
+    entry = _fetch_entry(
+        time, backend=backend, interpolate=interpolate,
+        max_log_time_gap=max_log_time_gap)
+    return entry["inv"], entry["sig"]
+
+
+def compute_inventory(
+        T, c_max, time, backend="gp", interpolate=False,
+        max_log_time_gap=1.0):
     """Computes the monoblock inventory as a function of the surface
     temperature, surface concentration and exposure time.
 
@@ -57,24 +461,34 @@ def compute_inventory(T, c_max, time):
         T (list): Surface temperature (K)
         c_max (list): Surface concentration (H m-3)
         time (float): Exposure time (s)
+        backend (str, optional): "gp", "surrogate", "table" or "sparse" (see
+            fetch_inventory_and_error()). Defaults to "gp".
+        interpolate (bool, optional): see fetch_inventory_and_error().
+            Defaults to False.
+        max_log_time_gap (float, optional): see
+            fetch_inventory_and_error(). Defaults to 1.0.
+
+    Raises:
+        TypeError: if T or c_max is not a list or an array
 
     Returns:
         numpy.array, numpy.array: list of inventories (H/m), list of standard
         deviation
     """
-    inv_T_c_local, sig_inv_local = fetch_inventory_and_error(time)
+    if np.ndim(T) == 0 or np.ndim(c_max) == 0:
+        raise TypeError("T and c_max should be lists or arrays")
+    inv_and_sig_local = _fetch_entry(
+        time, backend=backend, interpolate=interpolate,
+        max_log_time_gap=max_log_time_gap)["inv_and_sig"]
     # compute inventory (H/m) along divertor
-    inventories = [
-        float(inv_T_c_local(T_, c)) for T_, c in zip(T, c_max)]
-    sigmas = [
-        float(sig_inv_local(T_, c)) for T_, c in zip(T, c_max)]
-    inventories, sigmas = np.array(inventories), np.array(sigmas)
+    inventories, sigmas = inv_and_sig_local(T, c_max)
     return inventories, sigmas
 
 
 def compute_c_max(
         T, E_ion, E_atom, angles_ion, angles_atom,
-        ion_flux, atom_flux, full_export=False, isotope="H"):
+        ion_flux, atom_flux, full_export=False, isotope="H",
+        reflection_backend="gp"):
     """Computes the surface concentration based on exposure conditions.
 
     Args:
@@ -87,51 +501,59 @@ def compute_c_max(
         atom_flux (numpy.array): Atom flux (m-2 s-1)
         full_export (bool, optional): If True, the output will contain the
             surface concentration due to ions and atoms. Defaults to False.
-        isotope (str, optional): Type of hydrogen isotope amongst "H", "D",
-            "T". Defaults to "H".
+        isotope (str, list or dict, optional): Type of hydrogen isotope
+            amongst "H", "D", "T". If a list of isotopes is given, the
+            results are stacked along a first axis (one row per isotope).
+            If a dict {isotope: fraction} is given, the fluxes of each
+            isotope are scaled by its fraction and the results are stacked
+            likewise. Defaults to "H".
+        reflection_backend (str, optional): backend of reflection_coeff,
+            "gp" or "table". Defaults to "gp".
 
     Returns:
         numpy.array or (numpy.array, numpy.array, numpy.array): surface
         concentration or (surface concentration, surface conc. ions,
         surface conc. atoms)
     """
+    if isinstance(isotope, str):
+        isotopes, fractions = [isotope], [1]
+    elif isinstance(isotope, dict):
+        isotopes, fractions = list(isotope.keys()), list(isotope.values())
+    else:
+        isotopes, fractions = list(isotope), [1]*len(isotope)
+
     # Diffusion coefficient Fernandez et al Acta Materialia (2015)
     # https://doi.org/10.1016/j.actamat.2015.04.052
     D_0_W = 1.9e-7
     E_D_W = 0.2
     k_B = 8.617e-5
     D = D_0_W*np.exp(-E_D_W/k_B/T)
-    if isotope == "D":
-        D *= 1/2**0.5
-    elif isotope == "T":
-        D *= 1/3**0.5
+    # D scales as 1/sqrt(mass): c_max of each isotope is the c_max of H
+    # scaled by sqrt(mass) and by its fraction
+    masses = {"D": 2, "T": 3}
+    scaling = np.array([
+        masses.get(name, 1)**0.5*fraction
+        for name, fraction in zip(isotopes, fractions)])
+
     # implantation ranges
-    implantation_range_ions = [
-        float(implantation_range(energy, angle))
-        for energy, angle in zip(E_ion, angles_ion)]
-    implantation_range_atoms = [
-        float(implantation_range(energy, angle))
-        for energy, angle in zip(E_atom, angles_atom)]
+    implantation_range_ions = implantation_range(E_ion, angles_ion)
+    implantation_range_atoms = implantation_range(E_atom, angles_atom)
 
     # reflection coefficients
-    reflection_coeff_ions = [
-        float(reflection_coeff(energy, angle))
-        for energy, angle in zip(E_ion, angles_ion)]
-    reflection_coeff_atoms = [
-        float(reflection_coeff(energy, angle))
-        for energy, angle in zip(E_atom, angles_atom)]
-
-    reflection_coeff_ions = np.array(reflection_coeff_ions)
-    reflection_coeff_atoms = np.array(reflection_coeff_atoms)
-
-    implantation_range_ions = np.array(implantation_range_ions)
-    implantation_range_atoms = np.array(implantation_range_atoms)
+    reflection_coeff_ions = reflection_coeff(
+        E_ion, angles_ion, backend=reflection_backend)
+    reflection_coeff_atoms = reflection_coeff(
+        E_atom, angles_atom, backend=reflection_backend)
 
     # compute c_max
-    c_max_ions = (1 - reflection_coeff_ions) * \
-        ion_flux*implantation_range_ions/D
-    c_max_atoms = (1 - reflection_coeff_atoms) * \
-        atom_flux*implantation_range_atoms/D
+    c_max_ions = np.multiply.outer(
+        scaling,
+        (1 - reflection_coeff_ions)*ion_flux*implantation_range_ions/D)
+    c_max_atoms = np.multiply.outer(
+        scaling,
+        (1 - reflection_coeff_atoms)*atom_flux*implantation_range_atoms/D)
+    if isinstance(isotope, str):
+        c_max_ions, c_max_atoms = c_max_ions[0], c_max_atoms[0]
     c_max = c_max_ions + c_max_atoms
 
     if full_export:
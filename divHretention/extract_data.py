@@ -1,7 +1,139 @@
+import itertools
+
 import numpy as np
 from divHretention import DEFAULT_TIME, compute_c_max, compute_inventory, \
     compute_surface_temperature
 
+# columns required for each filetype (names cleaned as by np.genfromtxt)
+COLUMNS = {
+    "ITER": ["x", "Te", "Ti", "D_temp_atm", "D_flux_ion", "D_flux_atm",
+             "Wtot"],
+    "WEST": ["s_cell_m", "E_imp_ion_eV", "E_imp_atom_eV", "alpha_V_ion_deg",
+             "alpha_V_atom_deg", "flux_inc_ion_m2s1", "flux_inc_atom_m2s1",
+             "net_energy_flux_Wm2"],
+}
+
+DELIMITERS = {
+    "ITER": ",",
+    "WEST": ";",
+}
+
+# attributes written by stream_exposition()
+OUTPUT_COLUMNS = ["arc_length", "temperature", "concentration", "inventory",
+                  "stdev_inv"]
+
+# characters removed from the column names by np.genfromtxt
+_DELETECHARS = set("""~!@#$%^&*()-=+~\\|]}[{';: /?.>,<""")
+
+
+def clean_column_name(name):
+    """Cleans a column name the way np.genfromtxt(..., names=True) does
+    (eg. "s_cell [m]" -> "s_cell_m")
+
+    Args:
+        name (str): the column name
+
+    Returns:
+        str: the cleaned name
+    """
+    name = name.strip().replace(" ", "_")
+    return "".join(char for char in name if char not in _DELETECHARS)
+
+
+def read_header(filename, delimiter):
+    """Reads the column names in the first line of a file. A leading "#"
+    (as written by np.savetxt) is ignored.
+
+    Args:
+        filename (str): file path
+        delimiter (str): delimiter of the columns
+
+    Returns:
+        list: the cleaned column names
+    """
+    with open(filename, "r") as f:
+        header = f.readline().strip()
+    if header.startswith("#"):
+        header = header[1:]
+    return [clean_column_name(name) for name in header.split(delimiter)]
+
+
+def _usecols(filename, filetype):
+    header = read_header(filename, DELIMITERS[filetype])
+    missing = [
+        column for column in COLUMNS[filetype] if column not in header]
+    if missing:
+        raise ValueError(
+            "Missing columns {} in {}".format(", ".join(missing), filename))
+    return [header.index(column) for column in COLUMNS[filetype]]
+
+
+def _parse_rows(rows, filetype, usecols, skiprows=0):
+    # rows is a file path or a list of lines
+    columns = COLUMNS[filetype]
+    delimiter = DELIMITERS[filetype]
+    try:
+        values = np.loadtxt(
+            rows, delimiter=delimiter, skiprows=skiprows, usecols=usecols,
+            ndmin=2)
+    except ValueError:
+        values = np.genfromtxt(
+            rows, delimiter=delimiter, skip_header=skiprows, usecols=usecols)
+        values = values.reshape((-1, len(columns)))
+
+    data = np.empty(len(values), dtype=[(column, float) for column in columns])
+    for i, column in enumerate(columns):
+        data[column] = values[:, i]
+    return data
+
+
+def read_exposition_file(filename, filetype):
+    """Reads the columns of an exposure file required for a filetype (see
+    COLUMNS). Only these columns are parsed, with np.loadtxt, and
+    np.genfromtxt is used if np.loadtxt fails (eg. missing values).
+
+    Args:
+        filename (str): file path
+        filetype (str): "ITER" or "WEST"
+
+    Raises:
+        ValueError: if a required column is missing
+
+    Returns:
+        numpy.array: structured array with the required columns
+    """
+    return _parse_rows(
+        filename, filetype, _usecols(filename, filetype), skiprows=1)
+
+
+def read_exposition_file_chunks(filename, filetype, chunk_size=100000):
+    """Reads an exposure file like read_exposition_file() but by chunks of
+    rows, so that only one chunk is in memory at a time.
+
+    Args:
+        filename (str): file path
+        filetype (str): "ITER" or "WEST"
+        chunk_size (int, optional): number of rows per chunk. Defaults to
+            100000.
+
+    Raises:
+        ValueError: if a required column is missing
+
+    Yields:
+        numpy.array: structured array with the required columns of the
+        rows of the chunk
+    """
+    usecols = _usecols(filename, filetype)
+    with open(filename, "r") as f:
+        f.readline()  # header
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                break
+            if not any(line.strip() for line in lines):
+                continue
+            yield _parse_rows(lines, filetype, usecols)
+
 
 class Exposition:
     """Object containing information regarding the exposure conditions based
@@ -47,8 +179,11 @@ class Exposition:
         filetype (str): "ITER" or "WEST"
         inventory (bool, optional): If True, inventory will be computed on
             construction. Defaults to True.
+        data (numpy.array, optional): structured array with the columns of
+            the file (see read_exposition_file()). If given, the file is
+            not read. Defaults to None.
     """
-    def __init__(self, filename, filetype, inventory=True):
+    def __init__(self, filename, filetype, inventory=True, data=None):
         self.filename = filename
         self.filetype = filetype
         self.arc_length = []
@@ -59,7 +194,7 @@ class Exposition:
         self.net_heat_flux = []
         self.angles_ions = []
         self.angles_atoms = []
-        self.data = None
+        self.data = data
         self.extract_data()
         self.remove_nan_values()
 
@@ -89,7 +224,7 @@ class Exposition:
             self.ion_flux,
             self.atom_flux)
 
-    def compute_inventory(self, time=DEFAULT_TIME):
+    def compute_inventory(self, time=DEFAULT_TIME, backend="gp"):
         """Computes the H inventory and the standard deviation based on
         self.temperature, self.concentration and time. The inventory and
         standard deviation are stored in the attributes self.inventory and
@@ -98,13 +233,18 @@ class Exposition:
         Args:
             time (float, optional): Exposure time (s). Defaults to
                 DEFAULT_TIME.
+            backend (str, optional): "gp", "surrogate", "table" or "sparse"
+                (see :func:`fetch_inventory_and_error()
+                <divHretention.compute_inventory.fetch_inventory_and_error>`).
+                Defaults to "gp".
         """
         # compute inventory as a function of temperature and concentration
         self.inventory, self.stdev_inv = compute_inventory(
-            self.temperature, self.concentration, time=time)
+            self.temperature, self.concentration, time=time, backend=backend)
 
     def extract_data(self):
-        """Extracts exposure data from a CSV file
+        """Extracts exposure data from a CSV file (or from self.data if it
+        is already set)
         """
         if self.filetype not in ["ITER", "WEST"]:
             raise ValueError("Unknown filetype")
@@ -114,7 +254,8 @@ class Exposition:
             self.extract_WEST_data(self.filename)
 
     def extract_WEST_data(self, filename):
-        self.data = np.genfromtxt(filename, delimiter=";", names=True)
+        if self.data is None:
+            self.data = read_exposition_file(filename, "WEST")
 
         arc_length_0 = 0.6  # this is the assumed beggining of the target
 
@@ -128,7 +269,8 @@ class Exposition:
         self.net_heat_flux = self.data["net_energy_flux_Wm2"]
 
     def extract_ITER_data(self, filename):
-        self.data = np.genfromtxt(filename, delimiter=",", names=True)
+        if self.data is None:
+            self.data = read_exposition_file(filename, "ITER")
         self.arc_length = self.data["x"]
         self.E_ion = 3*self.data["Te"] + 2*self.data["Ti"]
 
@@ -156,5 +298,119 @@ class Exposition:
         np.nan_to_num(self.E_atom, copy=False, nan=default_energy)
 
 
+class ExpositionBatch(Exposition):
+    """Exposition of several files evaluated in one pass. The rows of all
+    the files are concatenated so that compute_c_max and compute_inventory
+    are called once for all the cases. The attributes (arc_length,
+    temperature, concentration, inventory...) are the flat arrays of all
+    the cases and batch[i] is a view on the case i.
+
+    Args:
+        filenames (list): file paths
+        filetype (str): "ITER" or "WEST" (the same for all the files)
+        inventory (bool, optional): If True, inventory will be computed on
+            construction. Defaults to True.
+
+    Attributes:
+        offsets (numpy.array): the rows of the case i are the rows
+            offsets[i] to offsets[i+1] of the flat arrays
+    """
+    def __init__(self, filenames, filetype, inventory=True):
+        if filetype not in ["ITER", "WEST"]:
+            raise ValueError("Unknown filetype")
+        self.filenames = list(filenames)
+        data = [
+            read_exposition_file(filename, filetype)
+            for filename in self.filenames]
+        self.offsets = np.concatenate(
+            ([0], np.cumsum([len(d) for d in data])))
+        super().__init__(
+            self.filenames, filetype, inventory=inventory,
+            data=np.concatenate(data))
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError("case index out of range")
+        return ExpositionView(self, i % len(self))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class ExpositionView:
+    """View on a case of an ExpositionBatch. The array attributes are
+    slices of the arrays of the batch.
+
+    Args:
+        batch (ExpositionBatch): the batch
+        i (int): index of the case
+    """
+    attributes = [
+        "data", "arc_length", "E_ion", "E_atom", "ion_flux", "atom_flux",
+        "net_heat_flux", "angles_ions", "angles_atoms", "temperature",
+        "concentration", "inventory", "stdev_inv"]
+
+    def __init__(self, batch, i):
+        self.batch = batch
+        self.filename = batch.filenames[i]
+        self.filetype = batch.filetype
+        self.rows = slice(batch.offsets[i], batch.offsets[i + 1])
+
+    def __getattr__(self, name):
+        if name in self.attributes:
+            return getattr(self.batch, name)[self.rows]
+        raise AttributeError(
+            "{} has no attribute {}".format(type(self).__name__, name))
+
+
+def stream_exposition(
+        filename, filetype, chunk_size=100000, time=DEFAULT_TIME,
+        backend="gp", output=None):
+    """Processes an exposure file by chunks of rows so that the peak memory
+    is proportional to chunk_size. Each chunk is an Exposition with the
+    surface temperature, the surface concentration and the inventory
+    computed.
+
+    Args:
+        filename (str): file path
+        filetype (str): "ITER" or "WEST"
+        chunk_size (int, optional): number of rows per chunk. Defaults to
+            100000.
+        time (float, optional): Exposure time (s). Defaults to
+            DEFAULT_TIME.
+        backend (str, optional): backend of the inventory (see
+            Exposition.compute_inventory()). Defaults to "gp".
+        output (str, optional): if given, the results (arc_length,
+            temperature, concentration, inventory, stdev_inv) are appended
+            to this CSV file after each chunk. Defaults to None.
+
+    Yields:
+        Exposition: the exposition of each chunk
+    """
+    if filetype not in ["ITER", "WEST"]:
+        raise ValueError("Unknown filetype")
+    if output is not None:
+        with open(output, "w") as f:
+            f.write(",".join(OUTPUT_COLUMNS) + "\n")
+
+    for data in read_exposition_file_chunks(filename, filetype, chunk_size):
+        exposition = Exposition(
+            filename, filetype, inventory=False, data=data)
+        exposition.compute_inventory(time=time, backend=backend)
+        if output is not None:
+            with open(output, "a") as f:
+                np.savetxt(
+                    f,
+                    np.column_stack(
+                        [getattr(exposition, name)
+                         for name in OUTPUT_COLUMNS]),
+                    delimiter=",")
+        yield exposition
+
+
 if __name__ == "__main__":
     pass
@@ -1,25 +1,32 @@
 import numpy as np
 import scipy as sp
-from scipy.interpolate import interp1d
-from .process_T_c_data import points, data
-from inference.gp_tools import GpRegressor
-from inference.gp_tools import RationalQuadratic
+from scipy.interpolate import RectBivariateSpline
+from scipy.linalg import cho_solve, solve_triangular
+from .process_T_c_data import database
 
 import divHretention
 
 
 def inv(points, time=1e7):
     ''' returns a 1D array'''
-    values = []
-    for p in points:
-        for d in data:
-            if d["T"] == p[0] and d["c"] == p[1]:
-                values.append(interp1d(d["t"], d["inventory"])(time))
-                break
-    return np.asarray(values)
+    index = database.index
+    ids = [index[p[0], p[1]] for p in points if (p[0], p[1]) in index]
+    return database.inventories_at(time)[ids]
 
 
-def estimate_inventory_with_gp_regression(time=1e7):
+def in_range_points():
+    """Selects the points of the database used for the regressions
+    (320 K <= T <= 1100 K and 1e20 m-3 <= c <= 1e23 m-3)
+
+    Returns:
+        numpy.array: boolean mask over database.points
+    """
+    T, c = database.points[:, 0], database.points[:, 1]
+    return (320 <= T) & (T <= 1100) & (1e20 <= c) & (c <= 1e23)
+
+
+def estimate_inventory_with_gp_regression(
+        time=1e7, regressor="exact", hyperpars=None, initial_hyperpars=None):
     """Estimate the monoblock inventory in H/m based on FESTIM results at a
     given time.
 
@@ -27,35 +34,363 @@ def estimate_inventory_with_gp_regression(time=1e7):
 
     Args:
         time (float, optional): Exposure time in seconds. Defaults to 1e7.
+        regressor (str, optional): "exact" trains a GpRegressor on the
+            database points subsampled with divHretention.step_mb. "sparse"
+            trains a SparseGpRegressor on all the database points with
+            the subsampled points as inducing points. Defaults to "exact".
+        hyperpars (list, optional): hyperparameters of the GP. If given,
+            the hyperparameters optimisation is skipped. Defaults to None.
+        initial_hyperpars (list, optional): starting point of the
+            hyperparameters optimisation (eg. the hyperparameters of a GP
+            trained at a close time). If None, a multistart optimisation is
+            performed. Defaults to None.
+
+    Raises:
+        ValueError: if the regressor is unknown
 
     Returns:
         GpRegressor: callable, usage GP(600, np.log10(1e20)) see
         https://inference-tools.readthedocs.io/en/stable/GpRegressor.html
     """
+    if regressor not in ["exact", "sparse"]:
+        raise ValueError("Unknown regressor")
+
     # with inference-tools
-    sim_points = []
-    z = []
-    for p in points:
-        if 320 <= p[0] <= 1100 and 1e20 <= p[1] <= 1e23:
-            sim_points.append([p[0], np.log10(p[1])])
-            z.append(np.log10(inv([p], time=time)))
-    sim_points = np.array(sim_points)
+    T, c = database.points[:, 0], database.points[:, 1]
+    in_range = in_range_points()
+    sim_points = np.column_stack((T[in_range], np.log10(c[in_range])))
+    z = np.log10(inv(database.points[in_range], time=time))
 
     # Train the GP on the data
-    GP = GpRegressor(
+    GP = build_inventory_gp(
         sim_points[:: divHretention.step_mb],
         z[:: divHretention.step_mb],
-        kernel=RationalQuadratic)
+        hyperpars=hyperpars, initial_hyperpars=initial_hyperpars)
+
+    if regressor == "sparse":
+        GP = SparseGpRegressor(sim_points, z, GP)
+    return GP
+
+
+class SparseGpRegressor:
+    """Sparse GP regression with inducing points (deterministic training
+    conditional approximation). The cost is O(n m^2) for n training points
+    and m inducing points instead of O(n^3).
+
+    The kernel, the hyperparameters and the inducing points are taken from
+    an exact GP trained on a subset of the data. The noise variance is the
+    mean squared residual of this GP on the whole training set.
+
+    Args:
+        x (numpy.array): training points with shape (n, number of
+            dimensions)
+        y (numpy.array): training values with shape (n,)
+        GP (GpRegressor): exact GP whose training points are the inducing
+            points
+
+    Attributes:
+        x (numpy.array): training points
+        y (numpy.array): training values
+        hyperpars (numpy.array): hyperparameters of GP
+        noise (float): standard deviation of the noise
+    """
+    def __init__(self, x, y, GP):
+        self.x = np.asarray(x)
+        self.y = np.asarray(y).squeeze()
+        self.hyperpars = GP.hyperpars
+        self.inducing_points = GP.x
+        self.cov = GP.cov
+        self.cov_hyperpars = GP.cov_hyperpars
+        self.mean = GP.mean_hyperpars[0]
+
+        residuals = GP(self.x)[0] - self.y
+        jitter = 1e-10*np.exp(2*self.cov_hyperpars[0])
+        self.noise = max(np.sqrt(np.mean(residuals**2)), np.sqrt(jitter))
+
+        K_mm = self.cov(
+            self.inducing_points, self.inducing_points, self.cov_hyperpars)
+        K_mm += jitter*np.eye(len(K_mm))
+        K_mn = self.cov(self.inducing_points, self.x, self.cov_hyperpars)
+        self.L_mm = np.linalg.cholesky(K_mm)
+        self.L_A = np.linalg.cholesky(K_mm + K_mn @ K_mn.T/self.noise**2)
+        self.alpha = np.linalg.solve(
+            self.L_A.T,
+            np.linalg.solve(
+                self.L_A, K_mn @ (self.y - self.mean)))/self.noise**2
+
+    def __call__(self, points):
+        """Calculates the mean and the standard deviation of the regression
+
+        Args:
+            points (numpy.array): points with shape (number of points,
+                number of dimensions)
 
-    # evaluate the estimate
-    Nx, Ny = 50, 10
-    gp_x = np.linspace(320, 1100, Nx)
-    gp_y = np.log10(np.logspace(20, 23, Ny))
-    gp_coords = [(i, j) for i in gp_x for j in gp_y]
-    mu, sig = GP(gp_coords)
+        Returns:
+            numpy.array, numpy.array: means, standard deviations
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        K_qm = self.cov(points, self.inducing_points, self.cov_hyperpars)
+        mu = self.mean + K_qm @ self.alpha
 
+        v_mm = np.linalg.solve(self.L_mm, K_qm.T)
+        v_A = np.linalg.solve(self.L_A, K_qm.T)
+        K_qq = np.exp(2*self.cov_hyperpars[0])
+        var = K_qq - np.sum(v_mm**2, axis=0) + np.sum(v_A**2, axis=0)
+        return mu, np.sqrt(np.abs(var))
+
+
+def estimate_inventory_with_time_gp_regression(
+        times=np.logspace(2, 7, num=11), step=16, y_err=1e-3):
+    """Estimate the monoblock inventory in H/m based on FESTIM results for
+    any exposure time with a single GP.
+
+    The regression is made on T, log(c_surface), log(time), log(inventory)
+
+    With the defaults (two times per decade, 352 training points), the
+    training takes a few seconds and the accuracy on the database curves
+    is close to the GP trained for a specific time (see
+    fetch_inventory_and_error()).
+
+    Args:
+        times (list, optional): Exposure times in seconds of the training
+            set. Defaults to np.logspace(2, 7, num=11).
+        step (int, optional): the database points are subsampled with this
+            step. If None, divHretention.step_mb is used. Defaults to 16.
+        y_err (float, optional): standard deviation of log10(inventory)
+            added to the training values. It keeps the covariance matrix
+            positive definite during the hyperparameters optimisation.
+            Defaults to 1e-3.
+
+    Returns:
+        GpRegressor: callable, usage
+        GP((600, np.log10(1e20), np.log10(1e5)))
+    """
+    # inference.gp_tools imports matplotlib.pyplot
+    from inference.gp_tools import GpRegressor, RationalQuadratic
+
+    if step is None:
+        step = divHretention.step_mb
+    ids = np.flatnonzero(in_range_points())[::step]
+    log_times = np.log10(times)
+    T, c = database.points[ids, 0], database.points[ids, 1]
+
+    sim_points = np.column_stack((
+        np.repeat(T, len(log_times)),
+        np.repeat(np.log10(c), len(log_times)),
+        np.tile(log_times, len(ids))))
+    z = np.log10(database.inventories_at(times)[ids]).ravel()
+
+    GP = GpRegressor(
+        sim_points, z, y_err=np.full(len(z), y_err),
+        kernel=RationalQuadratic)
     return GP
 
 
+def estimate_inventory_with_shared_gp_regression(times, hyperpars=None):
+    """Estimate the monoblock inventory in H/m based on FESTIM results at
+    several times with GPs sharing the same covariance matrix.
+
+    The training points (T, log(c_surface)) are the same for all times, so
+    the covariance matrix is factorised once and the log(inventory) of all
+    the times are solved as multiple right-hand sides.
+
+    Args:
+        times (list): Exposure times in seconds.
+        hyperpars (list, optional): hyperparameters of the GP. If None, the
+            hyperparameters are optimised on the median time. Defaults to
+            None.
+
+    Returns:
+        SharedGpRegressor: callable, usage GP((600, np.log10(1e20)))
+    """
+    ids = np.flatnonzero(in_range_points())[:: divHretention.step_mb]
+    T, c = database.points[ids, 0], database.points[ids, 1]
+    sim_points = np.column_stack((T, np.log10(c)))
+    z = np.log10(database.inventories_at(np.asarray(times))[ids])
+    z = z.reshape((len(ids), -1))
+
+    # the times may not be sorted
+    median = np.argsort(np.ravel(times))[z.shape[1]//2]
+    reference_GP = build_inventory_gp(
+        sim_points, z[:, median], hyperpars=hyperpars)
+    return SharedGpRegressor(reference_GP, z)
+
+
+class SharedGpRegressor:
+    """GP regression of several sets of values on the same training points
+    with the same covariance hyperparameters. The Cholesky factorisation of
+    the covariance matrix of a reference GP is reused for all the sets. The
+    constant mean of each set is its generalised least squares estimate.
+
+    Args:
+        GP (GpRegressor): reference GP trained on the training points
+        y (numpy.array): training values with shape (number of points,
+            number of sets)
+
+    Attributes:
+        means (numpy.array): constant means of the sets
+    """
+    def __init__(self, GP, y):
+        self.GP = GP
+        self.x = GP.x
+        self.y = np.asarray(y)
+        ones = np.ones(len(self.x))
+        K_inv_ones = cho_solve((GP.L, True), ones)
+        K_inv_y = cho_solve((GP.L, True), self.y)
+        self.means = ones @ K_inv_y/(ones @ K_inv_ones)
+        self.alpha = K_inv_y - np.outer(K_inv_ones, self.means)
+
+    def __call__(self, points):
+        """Calculates the means and the standard deviation of the
+        regression. The standard deviation is the same for all the sets.
+
+        Args:
+            points (numpy.array): points with shape (number of points,
+                number of dimensions)
+
+        Returns:
+            numpy.array, numpy.array: means with shape (number of points,
+            number of sets), standard deviations with shape
+            (number of points,)
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        K_qx = self.GP.cov(points, self.x, self.GP.cov_hyperpars)
+        mu = self.means + K_qx @ self.alpha
+        v = solve_triangular(self.GP.L, K_qx.T, lower=True)
+        K_qq = np.exp(2*self.GP.cov_hyperpars[0])
+        return mu, np.sqrt(np.abs(K_qq - np.sum(v**2, axis=0)))
+
+    def regressor(self, i):
+        """Returns the regression of one set
+
+        Args:
+            i (int): index of the set
+
+        Returns:
+            SharedGpView: callable, usage GP((600, np.log10(1e20)))
+        """
+        return SharedGpView(self, i)
+
+
+class SharedGpView:
+    """Regression of one set of a SharedGpRegressor. It has the same
+    interface as GpRegressor (x, y, hyperpars, __call__).
+
+    Args:
+        shared_GP (SharedGpRegressor): the shared regression
+        i (int): index of the set
+    """
+    def __init__(self, shared_GP, i):
+        self.shared_GP = shared_GP
+        self.i = i
+        self.x = shared_GP.x
+        self.y = shared_GP.y[:, i]
+        self.hyperpars = np.concatenate(
+            ([shared_GP.means[i]], shared_GP.GP.cov_hyperpars))
+
+    def __call__(self, points):
+        mu, sig = self.shared_GP(points)
+        return mu[:, self.i], sig
+
+
+class InventoryTable:
+    """Lookup table of a GP sampled on a regular (T, log10(c)) grid. The
+    mean and the standard deviation are interpolated with bicubic splines.
+    Points outside the grid are evaluated with the GP.
+
+    Args:
+        GP (callable): GP trained on (T, log10(c)), log10(inventory)
+        T_bounds (tuple, optional): limits of the grid for T (K). Defaults
+            to (320, 1100).
+        log_c_bounds (tuple, optional): limits of the grid for log10(c).
+            Defaults to (20, 23).
+        num_T (int, optional): number of grid points for T. Defaults to 40.
+        num_c (int, optional): number of grid points for log10(c). Defaults
+            to 241.
+
+    Attributes:
+        max_error (float): maximum absolute difference on log10(inventory)
+            between the table and the GP at the centres of the grid cells
+        max_sigma_error (float): maximum absolute difference on the
+            standard deviation between the table and the GP at the centres
+            of the grid cells
+    """
+    def __init__(
+            self, GP, T_bounds=(320, 1100), log_c_bounds=(20, 23),
+            num_T=40, num_c=241):
+        self.GP = GP
+        self.T_grid = np.linspace(*T_bounds, num=num_T)
+        self.log_c_grid = np.linspace(*log_c_bounds, num=num_c)
+
+        mu, sig = self._sample(self.T_grid, self.log_c_grid)
+        self.mu_spline = RectBivariateSpline(self.T_grid, self.log_c_grid, mu)
+        self.sig_spline = RectBivariateSpline(
+            self.T_grid, self.log_c_grid, sig)
+
+        # compare with the GP at the centres of the cells
+        T_centres = 0.5*(self.T_grid[1:] + self.T_grid[:-1])
+        log_c_centres = 0.5*(self.log_c_grid[1:] + self.log_c_grid[:-1])
+        mu_centres, sig_centres = self._sample(T_centres, log_c_centres)
+        self.max_error = np.abs(
+            self.mu_spline(T_centres, log_c_centres) - mu_centres).max()
+        self.max_sigma_error = np.abs(
+            self.sig_spline(T_centres, log_c_centres) - sig_centres).max()
+
+    def _sample(self, T, log_c):
+        TT, CC = np.meshgrid(T, log_c, indexing="ij")
+        mu, sig = self.GP(np.column_stack((TT.ravel(), CC.ravel())))
+        return mu.reshape(TT.shape), sig.reshape(TT.shape)
+
+    def __call__(self, points):
+        """Evaluates the table
+
+        Args:
+            points (numpy.array): (T, log10(c)) points with shape (N, 2)
+
+        Returns:
+            numpy.array, numpy.array: log10(inventory), standard deviation
+        """
+        points = np.atleast_2d(points)
+        T, log_c = points[:, 0], points[:, 1]
+        mu = self.mu_spline.ev(T, log_c)
+        sig = np.maximum(self.sig_spline.ev(T, log_c), 0)
+
+        outside = (T < self.T_grid[0]) | (T > self.T_grid[-1]) | \
+            (log_c < self.log_c_grid[0]) | (log_c > self.log_c_grid[-1])
+        if np.any(outside):
+            mu[outside], sig[outside] = self.GP(points[outside])
+        return mu, sig
+
+
+def build_inventory_gp(x, y, hyperpars=None, initial_hyperpars=None):
+    """Creates the GP used for the inventory regression.
+
+    Args:
+        x (numpy.array): training points (T, log10(c)) with shape (N, 2)
+        y (numpy.array): training values log10(inventory)
+        hyperpars (list, optional): hyperparameters of the GP. If None, the
+            hyperparameters are optimised. Defaults to None.
+        initial_hyperpars (list, optional): if given (and hyperpars is
+            None), the hyperparameters are optimised with a single BFGS run
+            starting from initial_hyperpars. Defaults to None.
+
+    Returns:
+        GpRegressor: callable, usage GP(600, np.log10(1e20))
+    """
+    # inference.gp_tools imports matplotlib.pyplot
+    from inference.gp_tools import GpRegressor, RationalQuadratic
+
+    if hyperpars is None and initial_hyperpars is not None:
+        GP = GpRegressor(
+            x, y, kernel=RationalQuadratic, hyperpars=initial_hyperpars)
+        # the bounds depend on the training data
+        lower, upper = np.array(GP.hp_bounds).T
+        x0 = np.clip(initial_hyperpars, lower, upper)
+        GP.set_hyperparameters(GP.launch_bfgs(x0)[0])
+        return GP
+
+    return GpRegressor(x, y, kernel=RationalQuadratic, hyperpars=hyperpars)
+
+
 if __name__ == "__main__":
     pass
@@ -125,17 +125,10 @@ class plot_Tc_map_with_subplots():
 
 
 def create_2d_inv_array(XX, YY, time=DEFAULT_TIME):
-    values = np.zeros(XX.shape)
-    min_value, max_value = float("inf"), float("-inf")
-    for i in range(len(XX)):
-        for j in range(len(XX[i])):
-            inventory = fetch_inventory_and_error(time)[0]
-            val = inventory(XX[i][j], YY[i][j])
-            values[i][j] = val
-            min_value = min(min_value, float(val))
-            max_value = max(max_value, float(val))
+    inventory = fetch_inventory_and_error(time)[0]
+    values = inventory(XX, YY)
     levels = np.logspace(
-        np.log10(min_value),
-        np.log10(max_value),
+        np.log10(values.min()),
+        np.log10(values.max()),
         1000)
     return values, levels
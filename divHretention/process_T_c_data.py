@@ -1,5 +1,7 @@
 import re
 import os
+import hashlib
+import threading
 from os import path
 
 import numpy as np
@@ -12,9 +14,18 @@ except ImportError:
     # Try backported to PY<37 `importlib_resources`.
     import importlib_resources as pkg_resources
 from divHretention import list_of_low_temp_files, list_of_high_temp_files
+from . import data as data_module
 from .data import mb_high_temp
 from .data import mb_low_temp
 
+BINARY_DATABASE_NAME = "mb_database.npy"
+
+BINARY_DATABASE_FILENAME = path.join(
+    path.dirname(data_module.__file__), BINARY_DATABASE_NAME)
+
+# length of the SHA1 digest stored at the beginning of the binary database
+_DIGEST_SIZE = 20
+
 
 def fit_powerlaw(x, y):
     slope, intercept, r_value, p_value, std_err = \
@@ -24,87 +35,411 @@ def fit_powerlaw(x, y):
     return a, b
 
 
-points = []
-data = []
-
-# extract high temp data
-strings = list_of_high_temp_files
-count = 0
-for s in strings:
-    match_number = re.compile(r'-?\ *[0-9]+\.?[0-9]*(?:[Ee]\ *-?\ *[0-9]+)?')
-    e = re.findall(match_number, s)
-    points.append([float(e[i])*10**float(e[i+1]) for i in [0, 2]])
-
-    data.append({})
-    data[-1]["T"] = points[-1][0]
-    data[-1]["c"] = points[-1][1]
-    t = []
-    inventory = []
-    with pkg_resources.path(mb_high_temp, s) as file_path:
-        with open(file_path, 'r') as csvfile:
-            plots = csv.reader(csvfile, delimiter=',')
-            next(plots)
-            for row in plots:
-                t.append(float(row[0]))
-                inventory.append(
-                    2*(float(row[-1]) +
-                        float(row[-2]) +
-                        float(row[-3])))
-    # extrapolate to small times
-    a, b = fit_powerlaw(t, inventory)
-    t_ = np.logspace(2, 4, num=100)
-    inventory_ = a*t_**b
-
-    data[-1]["t"] = t_.tolist() + t
-    data[-1]["inventory"] = inventory_.tolist() + inventory
-
-# extract low temp data
-L = 30e-3
-strings = list_of_low_temp_files
-
-for s in strings:
-    match_number = re.compile(r'-?\ *[0-9]+\.?[0-9]*(?:[Ee]\ *-?\ *[0-9]+)?')
-    e = re.findall(match_number, s)
-    a = [float(e[i])*10**float(e[i+1]) for i in [0, 2]]
-    points.append(a)
-
-    data.append({})
-    data[-1]["T"] = points[-1][0]
-    data[-1]["c"] = points[-1][1]
-
-    t = []
-    inventory = []
-    with pkg_resources.path(mb_low_temp, s) as file_path:
-        with open(file_path, 'r') as csvfile:
-            plots = csv.reader(csvfile, delimiter=',')
-            next(plots)
-            for row in plots:
-                t.append(float(row[0]))
-                inventory.append(
-                    L*(float(row[-1]) +
-                        float(row[-2]) +
-                        float(row[-3])))
-    a, b = fit_powerlaw(t, inventory)
-    t_ = np.logspace(5, 7, num=100)
-    inventory_ = a*t_**b
-    data[-1]["t"] = t + t_.tolist()
-    data[-1]["inventory"] = inventory + inventory_.tolist()
-
-T_ = 320
-for c in [*np.logspace(22 + np.log10(2), 23, num=7), *np.logspace(21 + np.log10(2), 22, num=7), *np.logspace(20 + np.log10(2), 21, num=7)]:
-    points.append([T_, c])
-
-    data.append({})
-    data[-1]["T"] = T_
-    data[-1]["c"] = c
-    t = np.logspace(2, 7, num=100)
-    D = 1.326e-10
-    n = 6.93e25
-    e = (t*2*D*c/n)**0.5
-    inv = n*e*L
-    data[-1]["t"] = t
-    data[-1]["inventory"] = inv
-
-
-points = np.asarray(points)
-# print(len(points), len(data))
+def read_csv_database():
+    """Reads the FESTIM simulations results from the CSV files listed in
+    divHretention.data.list_of_files and extrapolates them with power laws.
+
+    Returns:
+        numpy.array, list: the (T, c) points with shape (N, 2), the list of
+        dicts with keys "T", "c", "t", "inventory"
+    """
+    points = []
+    data = []
+
+    # extract high temp data
+    strings = list_of_high_temp_files
+    for s in strings:
+        match_number = re.compile(
+            r'-?\ *[0-9]+\.?[0-9]*(?:[Ee]\ *-?\ *[0-9]+)?')
+        e = re.findall(match_number, s)
+        points.append([float(e[i])*10**float(e[i+1]) for i in [0, 2]])
+
+        data.append({})
+        data[-1]["T"] = points[-1][0]
+        data[-1]["c"] = points[-1][1]
+        t = []
+        inventory = []
+        with pkg_resources.path(mb_high_temp, s) as file_path:
+            with open(file_path, 'r') as csvfile:
+                plots = csv.reader(csvfile, delimiter=',')
+                next(plots)
+                for row in plots:
+                    t.append(float(row[0]))
+                    inventory.append(
+                        2*(float(row[-1]) +
+                            float(row[-2]) +
+                            float(row[-3])))
+        # extrapolate to small times
+        a, b = fit_powerlaw(t, inventory)
+        t_ = np.logspace(2, 4, num=100)
+        inventory_ = a*t_**b
+
+        data[-1]["t"] = t_.tolist() + t
+        data[-1]["inventory"] = inventory_.tolist() + inventory
+
+    # extract low temp data
+    L = 30e-3
+    strings = list_of_low_temp_files
+
+    for s in strings:
+        match_number = re.compile(
+            r'-?\ *[0-9]+\.?[0-9]*(?:[Ee]\ *-?\ *[0-9]+)?')
+        e = re.findall(match_number, s)
+        a = [float(e[i])*10**float(e[i+1]) for i in [0, 2]]
+        points.append(a)
+
+        data.append({})
+        data[-1]["T"] = points[-1][0]
+        data[-1]["c"] = points[-1][1]
+
+        t = []
+        inventory = []
+        with pkg_resources.path(mb_low_temp, s) as file_path:
+            with open(file_path, 'r') as csvfile:
+                plots = csv.reader(csvfile, delimiter=',')
+                next(plots)
+                for row in plots:
+                    t.append(float(row[0]))
+                    inventory.append(
+                        L*(float(row[-1]) +
+                            float(row[-2]) +
+                            float(row[-3])))
+        a, b = fit_powerlaw(t, inventory)
+        t_ = np.logspace(5, 7, num=100)
+        inventory_ = a*t_**b
+        data[-1]["t"] = t + t_.tolist()
+        data[-1]["inventory"] = inventory + inventory_.tolist()
+
+    T_ = 320
+    for c in [*np.logspace(22 + np.log10(2), 23, num=7), *np.logspace(21 + np.log10(2), 22, num=7), *np.logspace(20 + np.log10(2), 21, num=7)]:
+        points.append([T_, c])
+
+        data.append({})
+        data[-1]["T"] = T_
+        data[-1]["c"] = c
+        t = np.logspace(2, 7, num=100)
+        D = 1.326e-10
+        n = 6.93e25
+        e = (t*2*D*c/n)**0.5
+        inv = n*e*L
+        data[-1]["t"] = t
+        data[-1]["inventory"] = inv
+
+    points = np.asarray(points)
+    return points, data
+
+
+def database_version(points, data):
+    """Computes the hash of the content of a database
+
+    Args:
+        points (numpy.array): the (T, c) points with shape (N, 2)
+        data (list): list of dicts with keys "t" and "inventory"
+
+    Returns:
+        str: the hexadecimal SHA1 hash
+    """
+    sha = hashlib.sha1()
+    sha.update(np.ascontiguousarray(points, dtype=float))
+    for d in data:
+        sha.update(np.ascontiguousarray(d["t"], dtype=float))
+        sha.update(np.ascontiguousarray(d["inventory"], dtype=float))
+    return sha.hexdigest()
+
+
+def csv_database_version():
+    """Computes a fingerprint of the CSV files of the database from their
+    names and sizes, without opening them. The modification times are not
+    used since they are not preserved by the installation of the package.
+
+    Returns:
+        str: the hexadecimal SHA1 hash
+    """
+    sha = hashlib.sha1()
+    for module, filenames in [
+            (mb_high_temp, list_of_high_temp_files),
+            (mb_low_temp, list_of_low_temp_files)]:
+        for filename in filenames:
+            with pkg_resources.path(module, filename) as file_path:
+                size = os.stat(file_path).st_size
+            sha.update("{}:{};".format(filename, size).encode())
+    return sha.hexdigest()
+
+
+def write_binary_database(filename, points, data, source_version):
+    """Packs the database in a single binary .npy file. The file contains a
+    1D float array with the following layout:
+
+    [digest, N, T_1, c_1, ..., T_N, c_N, offset_0, ..., offset_N, t,
+    inventory]
+
+    where digest is the 20 bytes of source_version, t and inventory are the
+    concatenations of all the curves and the curve i spans the indices
+    offset_i to offset_i+1 in t and inventory.
+
+    Args:
+        filename (str): path of the .npy file
+        points (numpy.array): the (T, c) points with shape (N, 2)
+        data (list): list of dicts with keys "t" and "inventory"
+        source_version (str): hexadecimal SHA1 fingerprint of the CSV files
+            the database was read from (see csv_database_version())
+    """
+    lengths = [len(d["t"]) for d in data]
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    packed = np.concatenate((
+        list(bytes.fromhex(source_version)),
+        [len(data)],
+        np.asarray(points, dtype=float).ravel(),
+        offsets,
+        np.concatenate([np.asarray(d["t"], dtype=float) for d in data]),
+        np.concatenate(
+            [np.asarray(d["inventory"], dtype=float) for d in data]),
+    ))
+    np.save(filename, packed)
+
+
+def binary_database_version(filename):
+    """Reads the fingerprint of the CSV files stored in a binary database
+
+    Args:
+        filename (str): path of the .npy file
+
+    Returns:
+        str: the hexadecimal SHA1 hash
+    """
+    packed = np.load(filename, mmap_mode="r")
+    return bytes(packed[:_DIGEST_SIZE].astype(np.uint8)).hex()
+
+
+def read_binary_database(filename, mmap_mode="r"):
+    """Reads a database written by write_binary_database(). By default, the
+    file is memory-mapped so that it can be shared between processes.
+
+    Args:
+        filename (str): path of the .npy file
+        mmap_mode (str, optional): mmap_mode of np.load. If None, the file
+            is read in memory. Defaults to "r".
+
+    Returns:
+        numpy.array, list: the (T, c) points with shape (N, 2), the list of
+        dicts with keys "T", "c", "t", "inventory"
+    """
+    packed = np.load(filename, mmap_mode=mmap_mode)[_DIGEST_SIZE:]
+    N = int(packed[0])
+    points = np.array(packed[1:1 + 2*N]).reshape((N, 2))
+    offsets = packed[1 + 2*N:2 + 3*N].astype(int)
+    t = packed[2 + 3*N:2 + 3*N + offsets[-1]]
+    inventory = packed[2 + 3*N + offsets[-1]:]
+
+    data = []
+    for (T, c), start, end in zip(points, offsets[:-1], offsets[1:]):
+        data.append({
+            "T": T,
+            "c": c,
+            "t": t[start:end],
+            "inventory": inventory[start:end]
+        })
+    return points, data
+
+
+def build_binary_database(filename=BINARY_DATABASE_FILENAME):
+    """Reads the CSV files and packs them in a single binary file used by
+    FESTIMDatabase in place of the CSV files.
+
+    Args:
+        filename (str, optional): path of the .npy file. Defaults to
+            BINARY_DATABASE_FILENAME.
+    """
+    points, data = read_csv_database()
+    write_binary_database(filename, points, data, csv_database_version())
+
+
+class FESTIMDatabase:
+    """Database of the FESTIM monoblock simulations. The files are only read
+    on first access to the attributes points or data, or when load() is
+    called explicitly.
+
+    If the binary file built by build_binary_database() exists and was
+    built from the current CSV files it is used, otherwise the CSV files
+    are read.
+
+    Args:
+        filename (str, optional): path of the binary database. If None, the
+            binary database of the package data (BINARY_DATABASE_NAME) is
+            used. Defaults to None.
+
+    Attributes:
+        points (numpy.array): the (T, c) points with shape (N, 2)
+        data (list): list of dicts with keys "T", "c", "t", "inventory"
+        version (str): hash of the content of the database
+        source_version (str): fingerprint of the CSV files of the database
+            (see csv_database_version()). Unlike version, it doesn't
+            require reading the database.
+        index (dict): index of the curves keyed by (T, c). For duplicated
+            points, the first curve is indexed.
+        sorted_curves (tuple): (keys, t, inventory, starts) all the
+            curves sorted by time and concatenated. keys is the curve index
+            plus the scaled log10(time) (see _scaled_log_time), so that a
+            single np.searchsorted locates a time in all the curves. The
+            curve i spans the indices starts[i] to starts[i+1].
+    """
+    def __init__(self, filename=None):
+        self.filename = filename
+        self._points = None
+        self._data = None
+        self._version = None
+        self._source_version = None
+        self._index = None
+        self._sorted_curves = None
+        # guards the lazy initialisations (reentrant since they call each
+        # other)
+        self._lock = threading.RLock()
+
+    @property
+    def loaded(self):
+        """bool: True if the database has been read"""
+        return self._data is not None
+
+    def load(self):
+        """Reads the database if it has not been read yet.
+
+        Returns:
+            FESTIMDatabase: the database itself
+        """
+        if not self.loaded:
+            with self._lock:
+                if not self.loaded:
+                    binary_database = self._read_binary_database()
+                    if binary_database is None:
+                        binary_database = read_csv_database()
+                    self._points, self._data = binary_database
+        return self
+
+    def _read_binary_database(self):
+        # returns None if there is no up-to-date binary database
+        if self.filename is not None:
+            return self._read_up_to_date(self.filename, mmap_mode="r")
+        try:
+            with pkg_resources.path(data_module, BINARY_DATABASE_NAME) as p:
+                # if the package is zipped, p is a temporary copy: the file
+                # is read in memory instead of being memory-mapped
+                in_place = path.dirname(str(p)) == \
+                    path.dirname(data_module.__file__)
+                return self._read_up_to_date(
+                    str(p), mmap_mode="r" if in_place else None)
+        except FileNotFoundError:
+            return None
+
+    def _read_up_to_date(self, filename, mmap_mode):
+        if not path.exists(filename) or \
+                binary_database_version(filename) != self.source_version:
+            return None
+        return read_binary_database(filename, mmap_mode=mmap_mode)
+
+    @property
+    def points(self):
+        return self.load()._points
+
+    @property
+    def data(self):
+        return self.load()._data
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    index = {}
+                    for i, (T, c) in enumerate(self.points):
+                        index.setdefault((T, c), i)
+                    self._index = index
+        return self._index
+
+    @property
+    def sorted_curves(self):
+        if self._sorted_curves is None:
+            with self._lock:
+                if self._sorted_curves is None:
+                    self._sorted_curves = self._build_sorted_curves()
+        return self._sorted_curves
+
+    def _build_sorted_curves(self):
+        keys, t, inventory = [], [], []
+        for i, d in enumerate(self.data):
+            # some curves are not sorted (the extrapolations and the CSV
+            # data interleave)
+            order = np.argsort(d["t"], kind="stable")
+            t.append(np.asarray(d["t"], dtype=float)[order])
+            inventory.append(np.asarray(d["inventory"], dtype=float)[order])
+            keys.append(i + _scaled_log_time(t[-1]))
+        starts = np.concatenate(([0], np.cumsum([len(t_i) for t_i in t])))
+        return (np.concatenate(keys), np.concatenate(t),
+                np.concatenate(inventory), starts)
+
+    def inventories_at(self, time):
+        """Computes the inventory of all the curves at given times by linear
+        interpolation, like scipy.interpolate.interp1d on each curve, but
+        with a single np.searchsorted for all the curves and all the times.
+
+        Args:
+            time (float or numpy.array): time(s) (s)
+
+        Raises:
+            ValueError: if a time is out of the range of a curve
+
+        Returns:
+            numpy.array: the inventories with shape (number of curves,) or
+            (number of curves, number of times)
+        """
+        keys, t, inventory, starts = self.sorted_curves
+        time = np.asarray(time, dtype=float)
+        if np.any(time < t[starts[:-1]].max()) or \
+                np.any(time > t[starts[1:] - 1].min()):
+            raise ValueError(
+                "A value in time is out of the range of a curve")
+
+        curves = np.arange(len(starts) - 1)[:, np.newaxis]
+        query = curves + _scaled_log_time(time.ravel())
+        j = np.searchsorted(keys, query, side="right")
+        # the last point of a curve is interpolated in its last segment
+        j = np.clip(j, starts[:-1, np.newaxis] + 1, starts[1:, np.newaxis] - 1)
+        w = (time.ravel() - t[j - 1])/(t[j] - t[j - 1])
+        values = (1 - w)*inventory[j - 1] + w*inventory[j]
+        return values.reshape((len(curves),) + time.shape)
+
+    @property
+    def version(self):
+        if self._version is None:
+            with self._lock:
+                if self._version is None:
+                    self._version = database_version(self.points, self.data)
+        return self._version
+
+    @property
+    def source_version(self):
+        if self._source_version is None:
+            with self._lock:
+                if self._source_version is None:
+                    self._source_version = csv_database_version()
+        return self._source_version
+
+
+def _scaled_log_time(time):
+    # maps 1e-10 s - 1e10 s to [0, 1)
+    return (np.log10(time) + 10)/20.5
+
+
+database = FESTIMDatabase()
+
+
+def __getattr__(name):
+    # backward compatibility: process_T_c_data.points and
+    # process_T_c_data.data trigger the loading of the database
+    if name in ["points", "data"]:
+        return getattr(database, name)
+    raise AttributeError(
+        "module {} has no attribute {}".format(__name__, name))
+
+
+if __name__ == "__main__":
+    build_binary_database()
@@ -0,0 +1,131 @@
+import os
+
+import numpy as np
+
+import divHretention
+from divHretention.cache import DiskCache, LRUCache
+from divHretention.process_T_c_data import database
+
+
+def test_disk_cache_round_trip(tmpdir):
+    """Checks that a GP stored in the disk cache is rebuilt with the same
+    training set and hyperparameters
+    """
+    # build
+    my_cache = DiskCache(str(tmpdir))
+    GP = divHretention.estimate_inventory_with_gp_regression(time=1e3)
+
+    # run
+    assert my_cache.load(1e3) is None
+    my_cache.save(1e3, GP)
+    rebuilt_GP = my_cache.load(1e3)
+
+    # test
+    assert os.path.exists(my_cache.filename(1e3))
+    assert np.array_equal(rebuilt_GP.x, GP.x)
+    assert np.array_equal(rebuilt_GP.y, GP.y)
+    assert np.array_equal(rebuilt_GP.hyperpars, GP.hyperpars)
+    assert np.allclose(rebuilt_GP((600, 21))[0], GP((600, 21))[0])
+
+
+def test_disk_cache_invalidated_by_database_version(tmpdir, monkeypatch):
+    """Checks that entries written with another database version are
+    ignored
+    """
+    # build
+    my_cache = DiskCache(str(tmpdir))
+    GP = divHretention.estimate_inventory_with_gp_regression(time=1e3)
+    my_cache.save(1e3, GP)
+
+    # run
+    monkeypatch.setattr(database, "_version", "another_version")
+
+    # test
+    assert my_cache.load(1e3) is None
+
+
+def test_fetch_inventory_and_error_uses_disk_cache(tmpdir):
+    """Checks that fetch_inventory_and_error writes the trained GPs in the
+    disk cache and reads them in a new session
+    """
+    # build
+    divHretention.database_inv_sig.clear()
+    divHretention.set_cache_directory(str(tmpdir))
+    test_time = 2e3
+
+    try:
+        # run
+        inv, sig = divHretention.fetch_inventory_and_error(test_time)
+        expected_value = inv(600, 1e21)
+        divHretention.database_inv_sig.clear()
+        inv, sig = divHretention.fetch_inventory_and_error(test_time)
+
+        # test
+        assert len(os.listdir(str(tmpdir))) == 1
+        assert np.isclose(inv(600, 1e21), expected_value)
+    finally:
+        divHretention.set_cache_directory(None)
+        divHretention.database_inv_sig.clear()
+
+
+def test_lru_cache_eviction():
+    """Checks that the least recently used entry is evicted when maxsize is
+    reached
+    """
+    # build
+    my_cache = LRUCache(maxsize=2)
+    my_cache[1e3] = "a"
+    my_cache[1e4] = "b"
+
+    # run
+    my_cache[1e3]
+    my_cache[1e5] = "c"
+
+    # test
+    assert 1e4 not in my_cache
+    assert 1e3 in my_cache and 1e5 in my_cache
+    assert my_cache.evictions == 1
+    assert len(my_cache) == 2
+
+
+def test_lru_cache_counters():
+    """Checks the hits and misses counters
+    """
+    my_cache = LRUCache()
+    my_cache[1e3] = "a"
+    assert my_cache.get(1e3) == "a"
+    assert my_cache.get(1e4) is None
+    assert my_cache.hits == 1
+    assert my_cache.misses == 1
+
+
+def test_lru_cache_relative_tolerance():
+    """Checks that keys within the relative tolerance share the same entry
+    """
+    my_cache = LRUCache(rtol=1e-9)
+    my_cache[1e7] = "a"
+    assert my_cache[10000000.000001] == "a"
+    my_cache[10000000.000001] = "b"
+    assert len(my_cache) == 1
+    assert list(my_cache) == [1e7]
+
+
+def test_lru_cache_key_lock_shared_by_close_keys():
+    """Checks that a key within the relative tolerance of a key whose lock
+    is in use gets the same key and lock, even if no entry is stored yet
+    """
+    my_cache = LRUCache(rtol=1e-9)
+    key, lock = my_cache.key_lock(1e7)
+    other_key, other_lock = my_cache.key_lock(10000000.000001)
+    assert other_key == key == 1e7
+    assert other_lock is lock
+
+
+def test_lru_cache_log_grid():
+    """Checks that keys are snapped to the log grid
+    """
+    my_cache = LRUCache(log_grid_step=0.1)
+    my_cache[1.1e3] = "a"
+    assert my_cache.normalise_key(1.1e3) == 10**3
+    assert my_cache[1.05e3] == "a"
+    assert 1.3e3 not in my_cache
@@ -1,3 +1,6 @@
+import subprocess
+import sys
+import threading
 import time
 import pytest
 import numpy as np
@@ -236,3 +239,433 @@ def test_compute_c_max_output():
 
     # test
     assert len(output) == 2
+
+
+def test_compute_c_max_several_isotopes():
+    """Checks that compute_c_max with a list or a dict of isotopes stacks
+    the results of each isotope
+    """
+    # build
+    T = np.array([600, 500])
+    E_ion = np.array([20, 10])
+    E_atom = np.array([30, 0])
+    angles_ion = np.array([60, 60])
+    angles_atom = np.array([45, 45])
+    ion_flux = np.array([1e21, 1e20])
+    atom_flux = np.array([2e21, 2e20])
+    arguments = (T, E_ion, E_atom, angles_ion, angles_atom, ion_flux,
+                 atom_flux)
+
+    # run
+    c_max, c_max_ions, c_max_atoms = divHretention.compute_c_max(
+        *arguments, full_export=True, isotope=["H", "D", "T"])
+    c_max_mixture = divHretention.compute_c_max(
+        *arguments, isotope={"D": 0.5, "T": 0.5})
+
+    # test
+    assert c_max.shape == c_max_ions.shape == c_max_atoms.shape == (3, 2)
+    for i, isotope in enumerate(["H", "D", "T"]):
+        expected = divHretention.compute_c_max(
+            *arguments, full_export=True, isotope=isotope)
+        for value, expected_value in zip(
+                (c_max, c_max_ions, c_max_atoms), expected):
+            assert np.allclose(value[i], expected_value)
+    assert np.allclose(c_max_mixture, 0.5*c_max[1:])
+
+
+def test_import_without_matplotlib():
+    """Checks that importing divHretention doesn't import matplotlib and that
+    the plotting API is still available
+    """
+    code = (
+        "import sys\n"
+        "import divHretention\n"
+        "assert 'matplotlib' not in sys.modules\n"
+        "divHretention.plot_along_divertor\n"
+        "assert 'matplotlib' in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_compute_inventory_matches_pointwise_evaluation():
+    """Checks that compute_inventory gives the same results as the
+    inventory and standard deviation evaluated point by point, including
+    points with a null concentration
+    """
+    # build
+    T = np.array([400, 600, 800, 1000])
+    c_max = np.array([1e21, 0, 1e22, 5e20])
+    time = 1e3
+    inv_T_c, sig_inv = divHretention.fetch_inventory_and_error(time)
+
+    # run
+    inv, sig = divHretention.compute_inventory(T, c_max, time)
+
+    # test
+    for i in range(len(T)):
+        assert np.isclose(inv[i], inv_T_c(T[i], c_max[i]))
+        assert np.isclose(sig[i], sig_inv(T[i], c_max[i]))
+    assert inv[1] == 0
+    assert sig[1] == 0
+
+
+def test_fetch_inventory_and_error_arrays():
+    """Checks that the callables returned by fetch_inventory_and_error
+    accept arrays of any shape and scalars
+    """
+    # build
+    inv_T_c, sig_inv = divHretention.fetch_inventory_and_error(1e3)
+    T = np.array([[400, 600, 800], [500, 700, 900]])
+    c = np.array([[1e21, 0, 1e22], [5e20, 2e21, 3e22]])
+
+    # run
+    inventories = inv_T_c(T, c)
+    sigmas = sig_inv(T, c)
+
+    # test
+    assert inventories.shape == T.shape
+    assert sigmas.shape == T.shape
+    for i in range(T.shape[0]):
+        for j in range(T.shape[1]):
+            assert np.isclose(inventories[i, j], inv_T_c(T[i, j], c[i, j]))
+            assert np.isclose(sigmas[i, j], sig_inv(T[i, j], c[i, j]))
+    assert np.ndim(inv_T_c(600, 1e21)) == 0
+    assert inv_T_c(T, 0).shape == T.shape
+
+
+def test_compute_inventory_surrogate_backend(monkeypatch):
+    """Checks that the surrogate backend evaluates the time GP at the
+    requested time without adding entries to database_inv_sig
+    """
+    # build
+    surrogate = divHretention.inventory_T_c.\
+        estimate_inventory_with_time_gp_regression(times=[1e3, 1e5], step=24)
+    # divHretention.compute_inventory is shadowed by the function
+    compute_inventory_module = sys.modules["divHretention.compute_inventory"]
+    monkeypatch.setattr(
+        compute_inventory_module, "inventory_surrogate", surrogate)
+    T = np.array([400, 600])
+    c_max = np.array([1e21, 0])
+    time = 1.2345e4
+
+    # run
+    inv, sig = divHretention.compute_inventory(
+        T, c_max, time, backend="surrogate")
+
+    # test
+    mu, expected_sig = surrogate((T[0], np.log10(c_max[0]), np.log10(time)))
+    assert np.isclose(inv[0], 10**mu[0])
+    assert np.isclose(sig[0], expected_sig[0])
+    assert inv[1] == 0
+    assert time not in divHretention.database_inv_sig
+
+
+def test_compute_inventory_unknown_backend():
+    """Checks that an unknown backend raises a ValueError
+    """
+    with pytest.raises(ValueError):
+        divHretention.compute_inventory([600], [1e21], 1e3, backend="foo")
+
+
+def test_compute_inventory_interpolate():
+    """Checks that with interpolate=True, the inventory at a time between
+    two cached times is interpolated in log10(time) without training a new
+    GP, and that a GP is trained when there is no bracket
+    """
+    # build
+    divHretention.database_inv_sig.clear()
+    T = np.array([600, 800])
+    c_max = np.array([1e21, 0])
+    inv_1, sig_1 = divHretention.compute_inventory(T, c_max, 1e3)
+    inv_2, sig_2 = divHretention.compute_inventory(T, c_max, 1e4)
+
+    # run
+    inv, sig = divHretention.compute_inventory(
+        T, c_max, 10**3.25, interpolate=True)
+
+    # test
+    expected_log_inv = 0.75*np.log10(inv_1[0]) + 0.25*np.log10(inv_2[0])
+    assert np.isclose(np.log10(inv[0]), expected_log_inv)
+    assert sig[0] >= 0.75*sig_1[0] + 0.25*sig_2[0]
+    assert inv[1] == 0
+    assert 10**3.25 not in divHretention.database_inv_sig
+
+    # run
+    divHretention.compute_inventory(
+        T, c_max, 1e5, interpolate=True)
+
+    # test
+    assert 1e5 in divHretention.database_inv_sig
+    divHretention.database_inv_sig.clear()
+
+
+def test_interpolation_doesnt_touch_cache_counters():
+    """Checks that interpolating between two entries doesn't count hits nor
+    refresh the LRU order of the bracketing entries
+    """
+    # build
+    compute_inventory_module = sys.modules["divHretention.compute_inventory"]
+    cache = divHretention.cache.LRUCache()
+    for t in [1e3, 1e4]:
+        cache[t] = {"inv_and_sig": lambda T, c: (np.ones(1), np.ones(1))}
+
+    # run
+    entry = compute_inventory_module._interpolate_entries(10**3.5, 1, cache)
+
+    # test
+    assert entry is not None
+    assert cache.hits == 0 and cache.misses == 0
+    assert list(cache) == [1e3, 1e4]
+
+
+def test_interpolation_with_evicted_bracket():
+    """Checks that no entry is interpolated if a bracketing entry is evicted
+    after the times of the cache are listed
+    """
+    # build
+    compute_inventory_module = sys.modules["divHretention.compute_inventory"]
+
+    class EvictingCache(divHretention.cache.LRUCache):
+        def __iter__(self):
+            times = super().__iter__()
+            self.pop(1e4)  # evicted by another thread
+            return times
+
+    cache = EvictingCache()
+    for t in [1e3, 1e4]:
+        cache[t] = {"inv_and_sig": lambda T, c: (np.ones(1), np.ones(1))}
+
+    # run
+    entry = compute_inventory_module._interpolate_entries(10**3.5, 1, cache)
+
+    # test
+    assert entry is None
+
+
+def test_interpolated_queries_dont_accumulate_key_locks():
+    """Checks that the locks of interpolated times, which are never stored
+    in database_inv_sig, are discarded
+    """
+    # build
+    divHretention.database_inv_sig.clear()
+    T = np.array([600])
+    c_max = np.array([1e21])
+    divHretention.compute_inventory(T, c_max, 1e3)
+    divHretention.compute_inventory(T, c_max, 1e4)
+
+    # run
+    for log_time in np.linspace(3.01, 3.99, num=200):
+        divHretention.compute_inventory(
+            T, c_max, 10**log_time, interpolate=True)
+
+    # test
+    assert len(divHretention.database_inv_sig) == 2
+    assert len(divHretention.database_inv_sig._key_locks) <= 2
+    divHretention.database_inv_sig.clear()
+
+
+def test_compute_inventory_table_backend():
+    """Checks that the table backend agrees with the GP within the
+    reported max_error and that the table is reused
+    """
+    # build
+    T = np.array([350, 600, 1000, 1200])
+    c_max = np.array([1e21, 3e22, 0, 1e21])
+    time = 1e3
+    expected_inv, expected_sig = divHretention.compute_inventory(
+        T, c_max, time)
+
+    # run
+    inv, sig = divHretention.compute_inventory(
+        T, c_max, time, backend="table")
+    table = divHretention.fetch_inventory_table(time)
+
+    # test
+    assert divHretention.fetch_inventory_table(time) is table
+    assert table.max_error < 0.01
+    # the standard deviation dips at the training points and is less
+    # accurately interpolated than the mean
+    assert 0 < table.max_sigma_error < 0.1
+    assert np.allclose(
+        np.log10(inv[c_max != 0]), np.log10(expected_inv[c_max != 0]),
+        atol=0.01)
+    assert inv[2] == 0
+    # T = 1200 K is outside the table and evaluated with the GP
+    assert inv[3] == expected_inv[3]
+
+
+def test_fetch_inventory_and_error_single_flight(monkeypatch):
+    """Checks that concurrent requests for the same uncached time train a
+    single GP
+    """
+    # build
+    compute_inventory_module = sys.modules["divHretention.compute_inventory"]
+    estimate = compute_inventory_module.estimate_inventory_with_gp_regression
+    calls = []
+
+    def counting_estimate(time, **kwargs):
+        calls.append(time)
+        return estimate(time=time, **kwargs)
+
+    monkeypatch.setattr(
+        compute_inventory_module, "estimate_inventory_with_gp_regression",
+        counting_estimate)
+    test_time = 3e3
+    divHretention.database_inv_sig.pop(test_time, None)
+    results = []
+
+    def fetch():
+        results.append(divHretention.fetch_inventory_and_error(test_time))
+
+    # run
+    threads = [threading.Thread(target=fetch) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # test
+    assert calls == [test_time]
+    assert len(results) == 4
+    assert all(result[0] is results[0][0] for result in results)
+
+
+def test_concurrent_close_times_train_once(monkeypatch):
+    """Checks that concurrent requests for uncached times within the
+    relative tolerance of database_inv_sig train a single GP
+    """
+    # build
+    compute_inventory_module = sys.modules["divHretention.compute_inventory"]
+    estimate = compute_inventory_module.estimate_inventory_with_gp_regression
+    calls = []
+
+    def slow_counting_estimate(**kwargs):
+        calls.append(kwargs["time"])
+        time.sleep(0.2)
+        return estimate(**kwargs)
+
+    monkeypatch.setattr(
+        compute_inventory_module, "estimate_inventory_with_gp_regression",
+        slow_counting_estimate)
+    test_times = [4e3, 4000.0000000001]
+    divHretention.database_inv_sig.pop(test_times[0], None)
+
+    # run
+    threads = [
+        threading.Thread(
+            target=divHretention.fetch_inventory_and_error, args=(t,))
+        for t in test_times]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # test
+    assert len(calls) == 1
+    divHretention.database_inv_sig.pop(test_times[0], None)
+
+
+def test_precompute_inventory_models():
+    """Checks that precompute_inventory_models adds the GPs of all the
+    times to database_inv_sig
+    """
+    # build
+    times = [1.5e3, 2.5e3]
+    for time in times:
+        divHretention.database_inv_sig.pop(time, None)
+
+    # run
+    divHretention.precompute_inventory_models(times, workers=2)
+
+    # test
+    for time in times:
+        assert time in divHretention.database_inv_sig
+    inv_T_c, sig_inv = divHretention.fetch_inventory_and_error(times[0])
+    assert inv_T_c(600, 1e21) > 0
+
+
+def test_precompute_inventory_models_shared():
+    """Checks that precompute_inventory_models with shared=True adds GPs
+    with the same covariance hyperparameters for all the times
+    """
+    # build
+    times = [3.5e3, 4.5e3]
+    for time in times:
+        divHretention.database_inv_sig.pop(time, None)
+
+    # run
+    divHretention.precompute_inventory_models(times, shared=True)
+
+    # test
+    GPs = [divHretention.database_inv_sig[time]["GP"] for time in times]
+    assert np.array_equal(GPs[0].hyperpars[1:], GPs[1].hyperpars[1:])
+    inv_T_c, sig_inv = divHretention.fetch_inventory_and_error(times[1])
+    assert inv_T_c(600, 1e21) > inv_T_c(600, 1e20) > 0
+
+
+def test_compute_inventory_sparse_backend():
+    """Checks that the sparse backend stores its entries in
+    database_inv_sig_sparse
+    """
+    # build
+    time = 1e3
+    divHretention.database_inv_sig_sparse.clear()
+
+    # run
+    inv, sig = divHretention.compute_inventory(
+        [600, 800], [1e21, 0], time, backend="sparse")
+
+    # test
+    assert time in divHretention.database_inv_sig_sparse
+    assert inv[0] > 0
+    assert inv[1] == 0
+
+
+def test_warm_start_from_closest_cached_time(monkeypatch):
+    """Checks that the hyperparameters of the closest cached time are used
+    as starting point of the optimisation
+    """
+    # build
+    divHretention.database_inv_sig.clear()
+    divHretention.fetch_inventory_and_error(1e3)
+    divHretention.fetch_inventory_and_error(1e5)
+    expected_hyperpars = divHretention.database_inv_sig[1e5]["GP"].hyperpars
+
+    compute_inventory_module = sys.modules["divHretention.compute_inventory"]
+    estimate = compute_inventory_module.estimate_inventory_with_gp_regression
+    initial_hyperpars = []
+
+    def recording_estimate(time, **kwargs):
+        initial_hyperpars.append(kwargs["initial_hyperpars"])
+        return estimate(time=time, **kwargs)
+
+    monkeypatch.setattr(
+        compute_inventory_module, "estimate_inventory_with_gp_regression",
+        recording_estimate)
+
+    # run
+    divHretention.fetch_inventory_and_error(3e4)
+
+    # test
+    assert np.array_equal(initial_hyperpars[0], expected_hyperpars)
+    divHretention.database_inv_sig.clear()
+
+
+def test_fixed_inventory_gp_hyperpars():
+    """Checks that fixed hyperparameters are used for new GPs
+    """
+    # build
+    hyperpars = divHretention.estimate_inventory_with_gp_regression(
+        time=1e3).hyperpars
+    divHretention.database_inv_sig.pop(4e3, None)
+
+    # run
+    divHretention.set_inventory_gp_hyperpars(hyperpars)
+    try:
+        divHretention.fetch_inventory_and_error(4e3)
+    finally:
+        divHretention.set_inventory_gp_hyperpars(None)
+
+    # test
+    GP = divHretention.database_inv_sig[4e3]["GP"]
+    assert np.array_equal(GP.hyperpars, hyperpars)
@@ -167,3 +167,112 @@ def test_process_file_ITER(tmpdir):
         divHretention.DEFAULT_TIME)
     assert np.array_equal(out.inventory, expected_inventory)
     assert np.array_equal(out.stdev_inv, expected_sigma)
+
+
+def test_read_exposition_file_selects_columns(tmpdir):
+    """Checks that read_exposition_file only returns the required columns,
+    with the same values as np.genfromtxt, for a WEST file with units in
+    the header, extra columns and NaN values
+    """
+    # build
+    d = tmpdir.mkdir("test_data")
+    filename = str(Path(d)) + "/example_WEST.csv"
+    header = "s_cell [m];flux_inc_ion [m-2.s-1];flux_imp_ion [m-2.s-1];E_imp_ion [eV];alpha_V_ion [deg];flux_inc_atom [m-2.s-1];E_imp_atom [eV];alpha_V_atom [deg];net_energy_flux [W.m-2]"
+    data = np.random.rand(20, 9)
+    data[::3, 4] = np.nan
+    np.savetxt(filename, data, delimiter=";", header=header, comments="")
+    expected_data = np.genfromtxt(filename, delimiter=";", names=True)
+
+    # run
+    data = divHretention.extract_data.read_exposition_file(filename, "WEST")
+
+    # test
+    assert data.dtype.names == tuple(divHretention.extract_data.COLUMNS["WEST"])
+    for col_head in data.dtype.names:
+        assert np.array_equal(
+            data[col_head], expected_data[col_head], equal_nan=True)
+
+
+def test_read_exposition_file_missing_column(tmpdir):
+    """Checks that a ValueError is raised when a required column is missing
+    """
+    # build
+    d = tmpdir.mkdir("test_data")
+    filename = str(Path(d)) + "/example_ITER.csv"
+    header = "x,Te,Ti,D_temp_atm,D_flux_ion,D_flux_atm"
+    np.savetxt(filename, np.ones((2, 6)), delimiter=",", header=header)
+
+    # run
+    with pytest.raises(ValueError):
+        divHretention.extract_data.read_exposition_file(filename, "ITER")
+
+
+def test_stream_exposition(tmpdir):
+    """Checks that streaming a file by chunks gives the same results as
+    Exposition and writes them in the output file
+    """
+    # build
+    d = tmpdir.mkdir("test_data")
+    filename = str(Path(d)) + "/example_ITER.csv"
+    output = str(Path(d)) + "/results.csv"
+    arc_length = np.linspace(0, 1)
+    Te = np.linspace(1, 2)
+    Ti = np.linspace(2, 3)
+    D_temp_atm = np.linspace(3, 4)
+    D_flux_atm = np.linspace(4e20, 5e20)
+    D_flux_ion = np.linspace(5e21, 6e21)
+    Wtot = np.linspace(6e6, 7e6)
+    header = "x,Te,Ti,D_temp_atm,D_flux_ion,D_flux_atm,Wtot"
+    data = np.asarray([arc_length, Te, Ti, D_temp_atm, D_flux_ion, D_flux_atm, Wtot]).T
+    np.savetxt(filename, data, delimiter=",", header=header)
+    my_exposure = divHretention.Exposition(filename, "ITER")
+
+    # run
+    chunks = list(divHretention.extract_data.stream_exposition(
+        filename, "ITER", chunk_size=15, output=output))
+
+    # test
+    assert [len(chunk.arc_length) for chunk in chunks] == [15, 15, 15, 5]
+    results = np.genfromtxt(output, delimiter=",", names=True)
+    for name in divHretention.extract_data.OUTPUT_COLUMNS:
+        expected = getattr(my_exposure, name)
+        assert np.allclose(
+            np.concatenate([getattr(chunk, name) for chunk in chunks]),
+            expected)
+        assert np.allclose(results[name], expected)
+
+
+def test_exposition_batch(tmpdir):
+    """Checks that the cases of an ExpositionBatch have the same results as
+    the Exposition of each file
+    """
+    # build
+    d = tmpdir.mkdir("test_data")
+    header = "s_cell_m;E_imp_ion_eV;E_imp_atom_eV;alpha_V_ion_deg;alpha_V_atom_deg;flux_inc_ion_m2s1;flux_inc_atom_m2s1;net_energy_flux_Wm2"
+    filenames = []
+    for i, num in enumerate([20, 35]):
+        filename = str(Path(d)) + "/example_WEST_{}.csv".format(i)
+        data = np.asarray([
+            np.linspace(0.6, 0.8, num), np.linspace(10, 100, num),
+            np.linspace(5, 50, num), np.linspace(40, 60, num),
+            np.linspace(30, 50, num), np.linspace(1e21, 1e22, num)*(i + 1),
+            np.linspace(1e20, 1e21, num), np.linspace(1e6, 5e6, num)]).T
+        np.savetxt(filename, data, delimiter=";", header=header)
+        filenames.append(filename)
+
+    # run
+    batch = divHretention.ExpositionBatch(filenames, "WEST")
+
+    # test
+    assert len(batch) == 2
+    assert np.array_equal(batch.offsets, [0, 20, 55])
+    assert len(batch.inventory) == 55
+    for filename, case in zip(filenames, batch):
+        my_exposure = divHretention.Exposition(filename, "WEST")
+        assert case.filename == filename
+        for name in ["arc_length", "temperature", "concentration",
+                     "inventory", "stdev_inv"]:
+            assert np.allclose(
+                getattr(case, name), getattr(my_exposure, name))
+    with pytest.raises(IndexError):
+        batch[2]
@@ -0,0 +1,209 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import divHretention
+from divHretention import compute_implantation_coefficients_angle as \
+    implantation_module
+
+
+def test_reflection_GP_not_trained_on_import():
+    """Checks that importing divHretention doesn't train the GP of the
+    reflection coefficient
+    """
+    code = (
+        "import divHretention\n"
+        "from divHretention import "
+        "compute_implantation_coefficients_angle as m\n"
+        "assert m._GP_reflection_coeff is None\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_reflection_GP_trained_once():
+    """Checks that the GP of the reflection coefficient is reused
+    """
+    GP = implantation_module.get_GP_reflection_coeff()
+    divHretention.reflection_coeff(20, 60)
+    assert implantation_module.get_GP_reflection_coeff() is GP
+    assert implantation_module.GP_reflection_coeff is GP
+
+
+def test_reflection_GP_with_given_hyperpars():
+    """Checks that pre-fitted hyperparameters are used by the GP of the
+    reflection coefficient
+    """
+    # build
+    hyperpars = implantation_module.get_GP_reflection_coeff().hyperpars
+    expected_value = divHretention.reflection_coeff(20, 60)
+
+    # run
+    implantation_module.set_GP_reflection_coeff_hyperpars(hyperpars)
+    GP = implantation_module.get_GP_reflection_coeff()
+
+    # test
+    assert np.array_equal(GP.hyperpars, hyperpars)
+    assert np.isclose(divHretention.reflection_coeff(20, 60), expected_value)
+
+
+def test_reflection_coeff_arrays():
+    """Checks that reflection_coeff evaluates arrays like scalars and that
+    zero energies give a zero coefficient
+    """
+    # build
+    energies = np.array([0, 20, 100, 500])
+    angles = np.array([45, 60, 0, 80])
+
+    # run
+    values = divHretention.reflection_coeff(energies, angles)
+
+    # test
+    assert values.shape == energies.shape
+    assert values[0] == 0
+    for E, angle, value in zip(energies, angles, values):
+        assert np.isclose(divHretention.reflection_coeff(E, angle), value)
+    assert np.ndim(divHretention.reflection_coeff(20, 60)) == 0
+
+
+def test_implantation_range_arrays():
+    """Checks that implantation_range evaluates arrays like scalars
+    """
+    energies = np.array([0, 20, 100])
+    values = divHretention.implantation_range(energies, 60)
+    assert values.shape == energies.shape
+    for E, value in zip(energies, values):
+        assert divHretention.implantation_range(E, 60) == value
+
+
+def test_reflection_coeff_table_backend():
+    """Checks that the table backend is close to the GP inside the grid
+    and uses the GP outside
+    """
+    # build
+    energies = np.array([0, 20, 100, 500, 5000])
+    angles = np.array([45, 60, 0, 80, 60])
+
+    # run
+    values_gp = divHretention.reflection_coeff(energies, angles)
+    values_table = divHretention.reflection_coeff(
+        energies, angles, backend="table")
+
+    # test
+    table = implantation_module.get_reflection_coeff_table()
+    assert table.max_error < 0.01
+    assert np.allclose(values_table, values_gp, atol=0.01)
+    assert values_table[0] == 0
+    assert values_table[-1] == values_gp[-1]
+
+
+def test_reflection_coeff_table_covers_low_energies(monkeypatch):
+    """Checks that the table backend doesn't use the GP for the low
+    energies and the grazing angles of the exposure files
+    """
+    # build
+    table = implantation_module.get_reflection_coeff_table()
+    energies = np.logspace(-6, 3, num=100)
+    angles = np.linspace(0, 90, num=100)
+    expected_values = divHretention.reflection_coeff(energies, angles)
+
+    def forbidden_GP():
+        raise AssertionError("the GP shouldn't be used")
+
+    monkeypatch.setattr(
+        implantation_module, "get_GP_reflection_coeff", forbidden_GP)
+
+    # run
+    values = table(np.log10(energies), angles)
+
+    # test
+    assert np.allclose(values, expected_values, atol=0.01)
+
+
+def test_reflection_coeff_table_save_and_load(tmpdir):
+    """Checks that a table read from a .npz file gives the same values
+    """
+    # build
+    filename = str(tmpdir.join("reflection_coeff_table.npz"))
+    table = implantation_module.get_reflection_coeff_table()
+
+    # run
+    table.save(filename)
+    loaded_table = implantation_module.ReflectionCoeffTable.load(filename)
+
+    # test
+    assert loaded_table.max_error == table.max_error
+    assert np.array_equal(loaded_table([1.5, 2.5], 60), table([1.5, 2.5], 60))
+
+
+def test_packaged_reflection_coeff_table_is_up_to_date():
+    """Checks that the table shipped with the package is the table sampled
+    from the GP with the current hyperparameters (run python -m
+    divHretention.compute_implantation_coefficients_angle to rebuild it)
+    """
+    # build
+    GP = implantation_module.get_GP_reflection_coeff()
+
+    # run
+    packaged_table = implantation_module.ReflectionCoeffTable.load(
+        implantation_module.REFLECTION_TABLE_FILENAME)
+    table = implantation_module.ReflectionCoeffTable.from_gp(GP)
+
+    # test
+    assert np.allclose(packaged_table.hyperpars, GP.hyperpars, rtol=1e-4)
+    assert np.array_equal(packaged_table.log_E_grid, table.log_E_grid)
+    assert np.array_equal(packaged_table.angle_grid, table.angle_grid)
+    assert np.allclose(packaged_table.values, table.values, atol=1e-6)
+
+
+def test_reflection_coeff_table_resampled_for_other_hyperpars():
+    """Checks that the packaged table isn't used when other hyperparameters
+    are set for the GP
+    """
+    # build
+    hyperpars = implantation_module.get_GP_reflection_coeff().hyperpars
+    other_hyperpars = np.array(hyperpars) + 0.1
+
+    try:
+        # run
+        implantation_module.set_GP_reflection_coeff_hyperpars(
+            other_hyperpars)
+        table = implantation_module.get_reflection_coeff_table()
+
+        # test
+        assert np.allclose(table.hyperpars, other_hyperpars)
+    finally:
+        implantation_module.set_GP_reflection_coeff_hyperpars(None)
+
+
+def test_reflection_coeff_unknown_backend():
+    """Checks that an unknown backend raises a ValueError
+    """
+    with pytest.raises(ValueError):
+        divHretention.reflection_coeff(20, 60, backend="foo")
+
+
+def test_reflection_coeff_memo():
+    """Checks that the distinct (energy, angle) pairs are evaluated once and
+    reused across calls when the memo is enabled
+    """
+    # build
+    energies = np.array([0, 20, 20, 100, 20, 0])
+    angles = np.array([60, 60, 60, 45, 45, 60])
+    expected_values = divHretention.reflection_coeff(energies, angles)
+    memo = implantation_module.set_reflection_coeff_memo(maxsize=2)
+
+    try:
+        # run
+        values = divHretention.reflection_coeff(energies, angles)
+        values_again = divHretention.reflection_coeff(energies[1:3], 60)
+
+        # test
+        assert np.array_equal(values, expected_values)
+        assert np.array_equal(values_again, expected_values[1:3])
+        assert memo.misses == 3
+        assert memo.hits == 1
+        assert len(memo) == 2
+    finally:
+        implantation_module.set_reflection_coeff_memo(0)
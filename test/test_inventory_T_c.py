@@ -0,0 +1,192 @@
+import sys
+
+import numpy as np
+import pytest
+from scipy.interpolate import interp1d
+
+from divHretention.inventory_T_c import inv, in_range_points, \
+    estimate_inventory_with_gp_regression, \
+    estimate_inventory_with_time_gp_regression, \
+    estimate_inventory_with_shared_gp_regression, build_inventory_gp
+from divHretention.process_T_c_data import database
+
+
+def test_inv_matches_database_curves():
+    """Checks that inv returns the interpolated inventory of the curve
+    corresponding to each (T, c) point
+    """
+    # build
+    time = 1e5
+    points = database.points[::10]
+
+    # run
+    values = inv(points, time=time)
+
+    # test
+    assert values.shape == (len(points),)
+    for p, value in zip(points, values):
+        d = next(
+            d for d in database.data if d["T"] == p[0] and d["c"] == p[1])
+        assert np.isclose(
+            value, interp1d(d["t"], d["inventory"])(time), rtol=1e-12)
+
+
+def test_inventories_at_matches_interp1d():
+    """Checks that inventories_at is the linear interpolation of every
+    curve (including the unsorted ones) at times between and on the data
+    points. Only round-off errors are tolerated.
+    """
+    # build
+    times = np.concatenate((np.logspace(2, 7, num=997), [500, 1e4, 1e5]))
+
+    # run
+    values = database.inventories_at(times)
+
+    # test
+    for d, value in zip(database.data, values):
+        expected = interp1d(d["t"], d["inventory"])(times)
+        assert np.allclose(value, expected, rtol=1e-12, atol=0)
+
+
+def test_inv_unknown_point_is_skipped():
+    """Checks that points that are not in the database are ignored
+    """
+    p = database.points[0]
+    values = inv([[12345, 1e20], p], time=1e5)
+    assert len(values) == 1
+
+
+def test_inventories_at_several_times():
+    """Checks that inventories_at evaluates all the curves at several times
+    in one call and matches the single time evaluation
+    """
+    # build
+    times = np.array([1e3, 2.5e4, 1e7])
+
+    # run
+    values = database.inventories_at(times)
+
+    # test
+    assert values.shape == (len(database.data), len(times))
+    for i, time in enumerate(times):
+        assert np.allclose(values[:, i], database.inventories_at(time))
+
+
+def test_inventories_at_outside_time_grid():
+    """Checks that inventories_at raises a ValueError when a curve is
+    evaluated outside of its time range
+    """
+    with pytest.raises(ValueError):
+        database.inventories_at(2e7)
+
+
+def test_time_gp_regression_training_set():
+    """Checks that the time GP is trained on (T, log10(c), log10(time)) and
+    reproduces the database at a training time
+    """
+    # build
+    times = [1e3, 1e5]
+
+    # run
+    GP = estimate_inventory_with_time_gp_regression(times=times, step=24)
+
+    # test
+    assert GP.x.shape[1] == 3
+    assert set(np.unique(GP.x[:, 2])) == set(np.log10(times))
+    mu, sig = GP(GP.x[:5])
+    assert np.allclose(mu, GP.y[:5], atol=0.1)
+
+
+def test_time_gp_regression_accuracy():
+    """Checks that the time GP trained with the default training set is
+    accurate on the database curves at long times between training times
+    """
+    # build
+    ids = np.flatnonzero(in_range_points())
+    T, c = database.points[ids, 0], database.points[ids, 1]
+
+    # run
+    GP = estimate_inventory_with_time_gp_regression()
+
+    # test
+    for time in [3e5, 3e6]:
+        mu, sig = GP(np.column_stack(
+            (T, np.log10(c), np.full(len(T), np.log10(time)))))
+        expected_mu = np.log10(database.inventories_at(time)[ids])
+        assert np.sqrt(np.mean((mu - expected_mu)**2)) < 0.06
+
+
+def test_sparse_gp_regression():
+    """Checks that the sparse regressor is trained on all the in-range
+    points and that it is closer to the database than the exact GP
+    """
+    # build
+    time = 1e5
+    in_range = in_range_points()
+    y = np.log10(database.inventories_at(time)[in_range])
+
+    # run
+    exact_GP = estimate_inventory_with_gp_regression(time=time)
+    sparse_GP = estimate_inventory_with_gp_regression(
+        time=time, regressor="sparse")
+
+    # test
+    assert len(sparse_GP.x) == in_range.sum()
+    mu_exact, sig_exact = exact_GP(sparse_GP.x)
+    mu_sparse, sig_sparse = sparse_GP(sparse_GP.x)
+    assert np.all(sig_sparse >= 0)
+    assert np.mean((mu_sparse - y)**2) < np.mean((mu_exact - y)**2)
+
+
+def test_unknown_regressor():
+    """Checks that an unknown regressor raises a ValueError
+    """
+    with pytest.raises(ValueError):
+        estimate_inventory_with_gp_regression(time=1e5, regressor="foo")
+
+
+def test_shared_gp_regression_matches_exact_gp():
+    """Checks that the regression of each time with the shared factorisation
+    is the exact GP with the same hyperparameters
+    """
+    # build
+    times = [1e3, 1e5, 1e7]
+    points = np.array([[600, 21], [900, 22.5], [400, 20.5]])
+
+    # run
+    shared_GP = estimate_inventory_with_shared_gp_regression(times)
+
+    # test
+    mu, sig = shared_GP(points)
+    assert mu.shape == (len(points), len(times))
+    assert sig.shape == (len(points),)
+    for i in range(len(times)):
+        GP = shared_GP.regressor(i)
+        exact_GP = build_inventory_gp(GP.x, GP.y, hyperpars=GP.hyperpars)
+        mu_exact, sig_exact = exact_GP(points)
+        assert np.allclose(GP(points)[0], mu_exact)
+        assert np.allclose(mu[:, i], mu_exact)
+        assert np.allclose(sig, sig_exact)
+
+
+def test_shared_gp_regression_optimised_on_median_time(monkeypatch):
+    """Checks that the hyperparameters of the shared GP are optimised on
+    the median time even if the times are not sorted
+    """
+    # build
+    times = [1e2, 1e7, 1e3]
+    inventory_module = sys.modules["divHretention.inventory_T_c"]
+    trained_y = []
+
+    def recording_build_inventory_gp(x, y, **kwargs):
+        trained_y.append(y)
+        return build_inventory_gp(x, y, **kwargs)
+
+    monkeypatch.setattr(
+        inventory_module, "build_inventory_gp", recording_build_inventory_gp)
+
+    # run
+    shared_GP = estimate_inventory_with_shared_gp_regression(times)
+
+    # test
+    assert np.array_equal(trained_y[0], shared_GP.y[:, 2])
@@ -0,0 +1,155 @@
+import builtins
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from divHretention.process_T_c_data import FESTIMDatabase, \
+    build_binary_database, write_binary_database, binary_database_version, \
+    csv_database_version, read_csv_database, read_binary_database, \
+    database_version, BINARY_DATABASE_FILENAME
+
+
+def test_database_is_not_loaded_on_import():
+    """Checks that importing divHretention doesn't read the FESTIM database
+    """
+    code = (
+        "import divHretention\n"
+        "from divHretention.process_T_c_data import database\n"
+        "assert not database.loaded\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_database_loads_on_first_access():
+    """Checks that the database is read when accessing points
+    """
+    # build
+    my_database = FESTIMDatabase()
+    assert not my_database.loaded
+
+    # run
+    points = my_database.points
+
+    # test
+    assert my_database.loaded
+    assert points.shape == (len(my_database.data), 2)
+
+
+def test_database_load_returns_itself():
+    """Checks that load() reads the database and returns the database
+    """
+    my_database = FESTIMDatabase()
+    assert my_database.load() is my_database
+    assert my_database.loaded
+    for p, d in zip(my_database.points, my_database.data):
+        assert np.array_equal(p, [d["T"], d["c"]])
+
+
+def test_binary_database_round_trip(tmpdir):
+    """Checks that the binary database contains the same curves as the CSV
+    files and that it is used by FESTIMDatabase when present
+    """
+    # build
+    filename = str(tmpdir.join("mb_database.npy"))
+    csv_database = FESTIMDatabase(filename=filename).load()
+
+    # run
+    build_binary_database(filename)
+    binary_database = FESTIMDatabase(filename=filename).load()
+
+    # test
+    assert binary_database_version(filename) == csv_database_version()
+    assert np.array_equal(binary_database.points, csv_database.points)
+    for d_binary, d_csv in zip(binary_database.data, csv_database.data):
+        assert d_binary["T"] == d_csv["T"]
+        assert d_binary["c"] == d_csv["c"]
+        assert np.array_equal(d_binary["t"], d_csv["t"])
+        assert np.array_equal(d_binary["inventory"], d_csv["inventory"])
+
+
+def test_packaged_binary_database_is_up_to_date():
+    """Checks that the binary database shipped with the package contains the
+    curves of the CSV files (run python -m
+    divHretention.process_T_c_data to rebuild it)
+    """
+    assert binary_database_version(BINARY_DATABASE_FILENAME) == \
+        csv_database_version()
+    assert database_version(*read_binary_database(BINARY_DATABASE_FILENAME)) \
+        == database_version(*read_csv_database())
+
+
+def test_binary_database_load_opens_a_single_file(tmpdir, monkeypatch):
+    """Checks that loading the binary database doesn't open the CSV files
+    """
+    # build
+    filename = str(tmpdir.join("mb_database.npy"))
+    build_binary_database(filename)
+    opened_files = []
+    builtin_open = builtins.open
+
+    def counting_open(file, *args, **kwargs):
+        opened_files.append(file)
+        return builtin_open(file, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "open", counting_open)
+
+    # run
+    FESTIMDatabase(filename=filename).load()
+
+    # test
+    assert set(str(f) for f in opened_files) == {filename}
+
+
+def test_database_loads_once_under_concurrent_access(monkeypatch):
+    """Checks that concurrent first accesses read the database only once
+    """
+    # build
+    process_module = sys.modules["divHretention.process_T_c_data"]
+    points, data = process_module.read_csv_database()
+    calls = []
+
+    def counting_read_csv_database():
+        calls.append(1)
+        time.sleep(0.1)
+        return points, data
+
+    monkeypatch.setattr(
+        process_module, "read_csv_database", counting_read_csv_database)
+    my_database = FESTIMDatabase(filename="does_not_exist.npy")
+
+    # run
+    threads = [
+        threading.Thread(target=lambda: my_database.sorted_curves)
+        for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # test
+    assert len(calls) == 1
+    assert len(my_database.sorted_curves[3]) == len(data) + 1
+
+
+def test_outdated_binary_database_is_ignored(tmpdir):
+    """Checks that a binary database built from other CSV files is not used
+    """
+    # build
+    filename = str(tmpdir.join("mb_database.npy"))
+    csv_database = FESTIMDatabase(filename=filename).load()
+    modified_data = [
+        {"t": d["t"], "inventory": 2*np.asarray(d["inventory"])}
+        for d in csv_database.data]
+    write_binary_database(
+        filename, csv_database.points, modified_data, "0"*40)
+
+    # run
+    my_database = FESTIMDatabase(filename=filename).load()
+
+    # test
+    assert binary_database_version(filename) == "0"*40
+    for d, d_csv in zip(my_database.data, csv_database.data):
+        assert np.array_equal(d["inventory"], d_csv["inventory"])